@@ -0,0 +1,66 @@
+import datetime
+import json
+import os
+import threading
+
+from config import logger
+
+
+def date_windows(start, end, days):
+    """Split the inclusive date range ``start``..``end`` into consecutive
+    inclusive windows of at most ``days`` days."""
+    if days < 1:
+        raise ValueError(f"Invalid window size: {days} days")
+    if end < start:
+        raise ValueError(f"Backfill range ends before it starts: {start} > {end}")
+
+    windows = []
+    while start <= end:
+        window_end = min(start + datetime.timedelta(days=days - 1), end)
+        windows.append((start, window_end))
+        start = window_end + datetime.timedelta(days=1)
+    return windows
+
+
+def window_key(window):
+    return f"{window[0].isoformat()}/{window[1].isoformat()}"
+
+
+class BackfillState:
+    """Small JSON file recording the windows of a backfill already written
+    to the output table, by request fingerprint, so that an interrupted
+    backfill only runs the missing windows again."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def completed(self, fingerprint):
+        with self._lock:
+            return set(self._read().get(fingerprint, {}))
+
+    def mark_completed(self, fingerprint, window, rows):
+        with self._lock:
+            state = self._read()
+            state.setdefault(fingerprint, {})[window_key(window)] = {
+                "rows": rows,
+                "completed_at": datetime.datetime.utcnow().isoformat(),
+            }
+            self._write(state)
+        logger.debug(f"Backfill window {window_key(window)} recorded as completed")
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable backfill state {self.path}: {e}")
+            return {}
+
+    def _write(self, state):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(f"{self.path}.tmp", self.path)
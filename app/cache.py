@@ -0,0 +1,157 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+from config import logger
+
+
+def request_fingerprint(
+    instruments,
+    fields,
+    identifier_type,
+    ti_usernumber,
+    ti_serialnumber,
+    ti_workstation,
+    date_range=None,
+):
+    """Hash everything that determines the content of a Bloomberg response:
+    the universe, the requested fields, the identifier type, the terminal
+    identity and the date range of a history request. Instruments are hashed
+    one by one so the universe can be any iterable."""
+    digest = hashlib.sha256()
+    header = {
+        "fields": [field for field in fields if not field.startswith("@@")],
+        "identifierType": identifier_type,
+        "terminalIdentity": [ti_usernumber, ti_serialnumber, ti_workstation],
+    }
+    if date_range is not None:
+        header["dateRange"] = [str(date) for date in date_range]
+    digest.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+    for instrument in instruments:
+        digest.update(b"\n" + str(instrument).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of downloaded responses, stored as Parquet files under
+    ``<directory>/<fingerprint>/<output key>.parquet`` next to a small JSON
+    metadata file. Entries older than ``max_age_hours`` are evicted, then the
+    oldest ones until the cache fits in ``max_mb``. Stores and evictions from
+    concurrent threads are serialized."""
+
+    def __init__(self, directory, max_mb, max_age_hours):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_age = datetime.timedelta(hours=max_age_hours)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def store(self, fingerprint, output_key, df, request_id=None):
+        with self._lock:
+            return self._store(fingerprint, output_key, df, request_id)
+
+    def _store(self, fingerprint, output_key, df, request_id):
+        entry_dir = os.path.join(self.directory, fingerprint)
+        os.makedirs(entry_dir, exist_ok=True)
+        name = self._entry_name(output_key)
+        path = os.path.join(entry_dir, f"{name}.parquet")
+        try:
+            df.to_parquet(f"{path}.tmp", engine="fastparquet", index=False)
+            os.replace(f"{path}.tmp", path)
+        except Exception as e:
+            logger.warning(f"Could not cache response {output_key}: {e}")
+            self._remove(f"{path}.tmp")
+            return None
+
+        metadata = {
+            "output_key": output_key,
+            "request_id": request_id,
+            "fingerprint": fingerprint,
+            "rows": len(df),
+            "created_at": datetime.datetime.utcnow().isoformat(),
+        }
+        metadata_path = os.path.join(entry_dir, f"{name}.json")
+        with open(f"{metadata_path}.tmp", "w") as f:
+            json.dump(metadata, f)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+        logger.info(f"Cached response {output_key} ({len(df)} rows) at {path}")
+        self._evict()
+        return path
+
+    def latest(self, fingerprint):
+        """Return the most recently cached response for ``fingerprint``."""
+        entries = [e for e in self._entries() if e["fingerprint"] == fingerprint]
+        if not entries:
+            return None
+
+        entry = max(entries, key=lambda e: e["created_at"])
+        logger.info(
+            f"Loading cached response {entry['output_key']} "
+            f"from {entry['created_at']:%Y-%m-%d %H:%M:%S}"
+        )
+        import pandas as pd
+
+        return pd.read_parquet(entry["path"], engine="fastparquet")
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e["created_at"])
+        expiration = datetime.datetime.utcnow() - self.max_age
+        total = sum(entry["size"] for entry in entries)
+        for entry in entries:
+            if entry["created_at"] >= expiration and total <= self.max_bytes:
+                break
+            logger.info(f"Evicting cached response {entry['output_key']}")
+            self._remove(entry["path"])
+            self._remove(entry["metadata_path"])
+            total -= entry["size"]
+
+    def _entries(self):
+        entries = []
+        for fingerprint in os.listdir(self.directory):
+            entry_dir = os.path.join(self.directory, fingerprint)
+            try:
+                filenames = os.listdir(entry_dir)
+            except (NotADirectoryError, FileNotFoundError):
+                continue
+            for filename in filenames:
+                if not filename.endswith(".json"):
+                    continue
+                metadata_path = os.path.join(entry_dir, filename)
+                path = f"{os.path.splitext(metadata_path)[0]}.parquet"
+                if not os.path.exists(path):
+                    self._remove(metadata_path)
+                    continue
+                # Another process may evict or rewrite the entry meanwhile
+                try:
+                    with open(metadata_path) as f:
+                        metadata = json.load(f)
+                    metadata.update(
+                        path=path,
+                        metadata_path=metadata_path,
+                        size=os.path.getsize(path),
+                        created_at=datetime.datetime.fromisoformat(
+                            metadata["created_at"]
+                        ),
+                    )
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Skipping cache entry {metadata_path}: {e}")
+                    continue
+                entries.append(metadata)
+        return entries
+
+    @staticmethod
+    def _entry_name(output_key):
+        return "".join(c if c.isalnum() or c in "._-" else "_" for c in output_key)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,120 @@
+import datetime
+import json
+import os
+
+from config import logger
+
+
+class Checkpoint:
+    """Small JSON file following the in-flight request through the pipeline
+    stages, so that a restarted run resumes instead of resubmitting.
+
+    ``submitted`` keeps what is needed to listen for the pending request
+    again; ``downloaded`` also spills the response next to the checkpoint so
+    a run that failed later restarts from the downloaded data. The
+    transform step of the bdlc CLI keeps its output next to it for the load
+    step.
+    """
+
+    SUBMITTED = "submitted"
+    DOWNLOADED = "downloaded"
+
+    def __init__(self, path, max_age_hours):
+        self.path = path
+        self.data_path = f"{os.path.splitext(path)[0]}.parquet"
+        self.transformed_path = f"{os.path.splitext(path)[0]}.transformed.pkl"
+        self.max_age = datetime.timedelta(hours=max_age_hours)
+
+    def load(self, fingerprint):
+        """Return the saved state if it matches ``fingerprint`` and has
+        not expired, otherwise None."""
+        state = self._read()
+        if state is None:
+            return None
+        if state.get("fingerprint") != fingerprint:
+            logger.info("Checkpoint belongs to a different request, ignoring it")
+            return None
+        return self._check(state)
+
+    def current(self):
+        """Return the saved state of the last submitted request, whatever
+        its fingerprint, if it has not expired, otherwise None."""
+        state = self._read()
+        return None if state is None else self._check(state)
+
+    def mark_submitted(self, fingerprint, fields, client_state):
+        self._write(
+            {
+                "stage": self.SUBMITTED,
+                "fingerprint": fingerprint,
+                "fields": fields,
+                "submitted_at": datetime.datetime.utcnow().isoformat(),
+                "client": client_state,
+            }
+        )
+
+    def mark_downloaded(self, df):
+        with open(self.path) as f:
+            state = json.load(f)
+        df.to_parquet(f"{self.data_path}.tmp", engine="fastparquet", index=False)
+        os.replace(f"{self.data_path}.tmp", self.data_path)
+        state["stage"] = self.DOWNLOADED
+        state["downloaded_at"] = datetime.datetime.utcnow().isoformat()
+        self._write(state)
+
+    def mark_transformed(self, df, sql_types):
+        # Pickled rather than Parquet: object columns of the transformed frame
+        # mix timestamps and None, and the load step must write them unchanged
+        with open(self.path) as f:
+            state = json.load(f)
+        df.to_pickle(f"{self.transformed_path}.tmp", compression=None)
+        os.replace(f"{self.transformed_path}.tmp", self.transformed_path)
+        state["transformed_at"] = datetime.datetime.utcnow().isoformat()
+        state["sql_types"] = sql_types
+        self._write(state)
+
+    def load_data(self):
+        import pandas as pd
+
+        return pd.read_parquet(self.data_path, engine="fastparquet")
+
+    def load_transformed(self):
+        import pandas as pd
+
+        return pd.read_pickle(self.transformed_path, compression=None)
+
+    def clear(self):
+        for path in (self.path, self.data_path, self.transformed_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+
+    def _check(self, state):
+        submitted_at = datetime.datetime.fromisoformat(state["submitted_at"])
+        if datetime.datetime.utcnow() - submitted_at > self.max_age:
+            logger.info(f"Checkpoint from {submitted_at} expired, ignoring it")
+            return None
+        if state["stage"] == self.DOWNLOADED and not os.path.exists(self.data_path):
+            logger.warning("Checkpointed response data is missing, ignoring it")
+            return None
+
+        logger.info(f"Resuming from checkpoint at stage '{state['stage']}'")
+        return state
+
+    def _write(self, state):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(f"{self.path}.tmp", self.path)
+        logger.debug(f"Checkpoint saved at stage '{state['stage']}'")
@@ -2,19 +2,31 @@ import datetime
 import gzip
 import io
 import json
+import logging
+import mmap
+import shutil
+import tempfile
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from json.encoder import encode_basestring_ascii
 from urllib.parse import urljoin
 
-import pandas as pd
-
-from app.session import Session
-from config import logger
+from app import stream
+from app.cache import request_fingerprint
+from app.download import ResumableDownload
+from app.notifications import NotificationListener
+from app.session import HTTPError, Session
+from config import logger, recorder
 
 
 class Client:
 
     HOST = "https://api.bloomberg.com"
+    DATA_FILE_SUFFIXES = (".json", ".json.gz")
+    SPOOL_COPY_SIZE = 1 << 20
+    UNIVERSE_PLACEHOLDER = "@@universe"
 
     def __init__(
         self,
@@ -26,116 +38,376 @@ class Client:
         ti_workstation: int,
         reply_timeout_min: int,
         identifier_type: str,
+        catalog_id: str = None,
+        listen_mode: str = "poll",
+        poll_interval_min: int = 60,
+        poll_interval_max: int = 60,
+        download_concurrency: int = 4,
+        download_max_resumes: int = 3,
+        spool_dir: str = None,
+        date_range: tuple = None,
+        history_period: str = "daily",
     ):
         self.instruments = instruments
         self.fields = fields
         self.reply_timeout_min = reply_timeout_min
         self.identifier_type = identifier_type
+        self.listen_mode = listen_mode
+        self.poll_interval_min = poll_interval_min
+        self.poll_interval_max = max(poll_interval_min, poll_interval_max)
+        self.download_concurrency = max(1, download_concurrency)
+        self.download_max_resumes = download_max_resumes
+        self.spool_dir = spool_dir or None
+        # A (start, end) date range makes a HistoryRequest of the range
+        self.date_range = date_range
+        self.history_period = history_period
         self.catalog_id = None
         self.catalog_url = None
         self.request_id = None
         self.request_url = None
         self.output_key = None
-        self.output_url = None
+        self.outputs = []
         self.session = session
         self.ti_usernumber = ti_usernumber
         self.ti_serialnumber = ti_serialnumber
         self.ti_workstation = ti_workstation
         self.session_id = self._generate_session_id()
-        self._get_catalog_id()
+        self.metadata_cache = session.metadata_cache
+        self.catalog_from_cache = False
+        if catalog_id is None and self.metadata_cache:
+            catalog_id = self.metadata_cache.catalog_id()
+            self.catalog_from_cache = catalog_id is not None
+        if catalog_id is None:
+            self._get_catalog_id()
+        else:
+            self._set_catalog(catalog_id)
         logger.info(f"Client initialized with session ID: {self.session_id}")
 
     def data_request(self):
-        url = urljoin(self.catalog_url, "requests/")
-        request_payload = self._get_request_payload()
-        logger.info(f"Sending data request to URL: {url}")
-        logger.debug(f"Request payload: {json.dumps(request_payload, indent=2)}")
-        response = self.session.post(url, json=request_payload)
+        request_body = self._get_request_body()
+        with recorder.stage("submit") as metrics:
+            try:
+                response = self._submit(request_body)
+            except HTTPError as e:
+                # The first use validates a catalog ID read from the cache
+                if e.response.status_code != 404 or not self.catalog_from_cache:
+                    raise
+                logger.warning("Cached catalog ID rejected, looking it up again")
+                self.metadata_cache.invalidate_catalog()
+                self.catalog_from_cache = False
+                self._get_catalog_id()
+                response = self._submit(request_body)
+            metrics["rows"] = len(self.instruments)
+            metrics["bytes"] = len(request_body)
         self.request_url = urljoin(self.HOST, response.headers["Location"])
         self.request_id = response.json()["request"]["identifier"]
         logger.info(f"Data request sent, request ID: {self.request_id}")
 
+    def _submit(self, request_body):
+        url = urljoin(self.catalog_url, "requests/")
+        logger.info(f"Sending data request to URL: {url}")
+        return self.session.post(
+            url, data=request_body, headers={"Content-Type": "application/json"}
+        )
+
     def listen(self):
         logger.info("Listening for data response...")
-        if self.__listen():
+        with recorder.stage("turnaround"):
+            received = self.__listen()
+        if received:
             logger.info("Data response received, proceeding with download.")
             return self.__download()
         logger.warning("Data response not received within the timeout period.")
         return
 
+    def listen_chunks(self, chunk_size):
+        """Listen for the data response and yield it as DataFrames of at
+        most ``chunk_size`` rows, parsed while the download is streaming.
+        """
+        logger.info("Listening for data response...")
+        with recorder.stage("turnaround"):
+            received = self.__listen()
+        if received:
+            logger.info("Data response received, proceeding with streamed download.")
+            yield from self.__iter_download(chunk_size)
+            return
+        logger.warning("Data response not received within the timeout period.")
+
+    def ready(self):
+        """Check once, without waiting, whether the response was delivered."""
+        return self._poll_responses(*self._responses_query())
+
     def __listen(self):
-        url = urljoin(self.catalog_url, "content/responses/")
+        url, params = self._responses_query()
         logger.info(f"Listening on URL: {url}")
-        params = {
-            "prefix": self.session_id,
-            "requestIdentifier": self.request_id,
-        }
         now = datetime.datetime.utcnow()
         reply_timeout = datetime.timedelta(minutes=self.reply_timeout_min)
         expiration_timestamp = now + reply_timeout
-        while now < expiration_timestamp:
-            response = self.session.get(url, params=params)
-            data = response.json()["contains"]
-            if len(data):
-                output = data[0]
-                logger.info("Response listing:\n%s", json.dumps(output, indent=2))
-                self.output_key = output["key"]
-                self.output_url = urljoin(
-                    self.catalog_url, f"content/responses/{self.output_key}"
-                )
+        if self.listen_mode == "sse":
+            if self.__wait_for_notification(url, params, expiration_timestamp):
+                return True
+
+        interval = self.poll_interval_min
+        while datetime.datetime.utcnow() < expiration_timestamp:
+            if self._poll_responses(url, params):
                 return True
-            else:
-                time.sleep(60)
+            time.sleep(interval)
+            interval = min(interval * 2, self.poll_interval_max)
 
         logger.info(
             f"Response not received within {self.reply_timeout_min} minutes. Exiting."
         )
         return False
 
+    def __wait_for_notification(self, url, params, expiration_timestamp):
+        listener = NotificationListener(
+            self.session, self.HOST, self.catalog_id, self.session_id
+        )
+        try:
+            # The delivery may have happened before the subscription was opened
+            listener.wait(
+                expiration_timestamp,
+                on_subscribed=lambda: self._poll_responses(url, params),
+            )
+        except Exception as e:
+            logger.warning(f"Notification stream dropped, falling back to polling: {e}")
+            return False
+
+        # Listed once notified, and looked up once more at the expiry in case
+        # the notification was missed
+        return self._poll_responses(url, params)
+
+    def _responses_query(self):
+        url = urljoin(self.catalog_url, "content/responses/")
+        params = {
+            "prefix": self.session_id,
+            "requestIdentifier": self.request_id,
+        }
+        return url, params
+
+    def _poll_responses(self, url, params):
+        response = self.session.get(url, params=params)
+        listing = response.json()["contains"]
+        # A large delivery is split into several parts, possibly next to
+        # files without data
+        outputs = [
+            entry for entry in listing if entry["key"].endswith(self.DATA_FILE_SUFFIXES)
+        ]
+        if not outputs:
+            if listing:
+                keys = [entry["key"] for entry in listing]
+                logger.info(f"No data file in the response listing yet: {keys}")
+            return False
+
+        logger.info("Response listing:\n%s", json.dumps(outputs, indent=2))
+        self.outputs = sorted(outputs, key=lambda entry: entry["key"])
+        self.output_key = self.outputs[0]["key"]
+        if len(self.outputs) > 1:
+            self.output_key += f"+{len(self.outputs) - 1}"
+        return True
+
     def __download(self):
-        logger.info(f"Downloading data from URL: {self.output_url}")
-        with self.session.get(self.output_url, stream=True) as response:
-            output_filename = self.output_key
-            if "content-encoding" in response.headers:
-                if not response.headers["content-encoding"] == "gzip":
-                    raise RuntimeError(
-                        "Unsupported content encoding received in the response"
-                    )
-
-            uncompressed = gzip.GzipFile(fileobj=response.raw)
-            data = uncompressed.read()
-            df = pd.read_json(io.BytesIO(data))
+        # Imported here so that polling for a delivery does not load pandas
+        import pandas as pd
+
+        logger.info(f"Downloading {len(self.outputs)} response file(s)")
+        with recorder.stage("download") as metrics:
+            with ThreadPoolExecutor(self.download_concurrency) as executor:
+                parts = list(executor.map(self._download_part, self.outputs))
+            metrics["bytes"] = sum(received for _, received in parts)
+        with recorder.stage("parse") as metrics:
+            frames = []
+            parsed = 0
+            while parts:
+                spool, _ = parts.pop(0)
+                with spool, mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    uncompressed = gzip.GzipFile(fileobj=m)
+                    frames.append(pd.read_json(uncompressed))
+                    parsed += uncompressed.tell()
+            df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+            metrics["rows"] = len(df)
+            metrics["bytes"] = parsed
 
         logger.info(
-            f"File downloaded and data loaded into DataFrame: {output_filename}"
+            f"File downloaded and data loaded into DataFrame: {self.output_key}"
         )
         return df
 
+    def _download_part(self, entry):
+        """Spool one compressed response file to a temporary file, which
+        the parser then maps instead of holding the body in memory.
+
+        :return: the spool file and the number of bytes received
+        """
+        spool = tempfile.TemporaryFile(dir=self.spool_dir)
+        try:
+            with self._open_part(entry) as download:
+                shutil.copyfileobj(download, spool, self.SPOOL_COPY_SIZE)
+            # The parser maps the file: nothing may be left in the buffer
+            spool.flush()
+            self._check_part(entry, download)
+        except BaseException:
+            spool.close()
+            raise
+        return spool, download.position
+
+    def _open_part(self, entry):
+        url = self._output_url(entry["key"])
+        logger.info(f"Downloading data from URL: {url}")
+        download = ResumableDownload(
+            self.session,
+            url,
+            size=entry.get("contentLength"),
+            max_resumes=self.download_max_resumes,
+        )
+        try:
+            self._check_content_encoding(download)
+        except BaseException:
+            download.close()
+            raise
+        return download
+
+    def __iter_download(self, chunk_size):
+        rows = 0
+        received = 0
+        with recorder.stage("download_parse") as metrics:
+            for entry in self.outputs:
+                with self._open_part(entry) as download:
+                    uncompressed = gzip.GzipFile(fileobj=download)
+                    for df in stream.iter_frames(uncompressed, chunk_size):
+                        rows += len(df)
+                        logger.debug(f"Parsed chunk of {len(df)} rows ({rows} so far)")
+                        yield df
+                self._check_part(entry, download)
+                received += download.position
+            metrics["bytes"] = received
+            metrics["rows"] = rows
+
+        logger.info(f"File streamed: {self.output_key} ({rows} rows)")
+
+    def _output_url(self, key):
+        return urljoin(self.catalog_url, f"content/responses/{key}")
+
+    @staticmethod
+    def _check_part(entry, download):
+        """Compare a downloaded file with its listing entry, so that a
+        truncated or since replaced file is not loaded. The content itself
+        is checked by the CRC-32 of the gzip trailer when decompressed."""
+        key = entry["key"]
+        expected = entry.get("contentLength")
+        received = download.position
+        if expected is not None and received != int(expected):
+            raise RuntimeError(
+                f"Response file {key} has {received} bytes, {expected} listed"
+            )
+
+        listed = entry.get("lastModified")
+        served = download.headers.get("Last-Modified")
+        if listed and served:
+            listed_at = datetime.datetime.fromisoformat(listed)
+            if listed_at.tzinfo is None:
+                listed_at = listed_at.replace(tzinfo=datetime.timezone.utc)
+            # Last-Modified has a precision of one second
+            drift = abs(listed_at - parsedate_to_datetime(served))
+            if drift >= datetime.timedelta(seconds=1):
+                raise RuntimeError(
+                    f"Response file {key} was modified at {served}, " f"{listed} listed"
+                )
+
+    @staticmethod
+    def _check_content_encoding(response):
+        if "content-encoding" in response.headers:
+            if not response.headers["content-encoding"] == "gzip":
+                raise RuntimeError(
+                    "Unsupported content encoding received in the response"
+                )
+
     def _get_catalog_id(self):
         url = urljoin(self.HOST, "/eap/catalogs/")
         logger.info(f"Fetching catalog ID from URL: {url}")
-        response = self.session.get(url)
+        with recorder.stage("catalog"):
+            response = self.session.get(url)
         catalogs = response.json()["contains"]
         for catalog in catalogs:
             if catalog["subscriptionType"] == "scheduled":
-                self.catalog_id = catalog["identifier"]
-                self.catalog_url = urljoin(
-                    self.HOST, f"/eap/catalogs/{self.catalog_id}/"
-                )
+                self._set_catalog(catalog["identifier"])
                 logger.info(f"Scheduled catalog found with ID: {self.catalog_id}")
+                if self.metadata_cache:
+                    self.metadata_cache.store_catalog(self.catalog_id)
                 break
         else:
             logger.error("Scheduled catalog not in %r", response.json()["contains"])
             raise RuntimeError("Scheduled catalog not found")
 
+    def checkpoint_state(self):
+        return {
+            "catalog_id": self.catalog_id,
+            "session_id": self.session_id,
+            "request_id": self.request_id,
+            "request_url": self.request_url,
+        }
+
+    def resume(self, state):
+        """Listen for a request submitted by a previous run instead of
+        submitting a new one."""
+        self._set_catalog(state["catalog_id"])
+        self.session_id = state["session_id"]
+        self.request_id = state["request_id"]
+        self.request_url = state["request_url"]
+        logger.info(f"Resumed data request, request ID: {self.request_id}")
+
+    def fingerprint(self):
+        return request_fingerprint(
+            self.instruments,
+            self.fields,
+            self.identifier_type,
+            self.ti_usernumber,
+            self.ti_serialnumber,
+            self.ti_workstation,
+            date_range=self.date_range,
+        )
+
+    def _set_catalog(self, catalog_id):
+        self.catalog_id = catalog_id
+        self.catalog_url = urljoin(self.HOST, f"/eap/catalogs/{self.catalog_id}/")
+
+    def _get_request_body(self):
+        """Serialize the request payload to JSON. The universe is written
+        into the body identifier by identifier, without a dict per
+        instrument, so a large universe costs little more than the body."""
+        request_payload = self._get_request_payload()
+        head, _, tail = json.dumps(request_payload).partition(
+            json.dumps(self.UNIVERSE_PLACEHOLDER)
+        )
+        body = io.BytesIO()
+        body.write(head.encode())
+        body.write(b"[")
+        self._write_universe(body)
+        body.write(b"]")
+        body.write(tail.encode())
+        return body.getvalue()
+
+    def _write_universe(self, body):
+        identifier = (
+            '{"@type": "Identifier", "identifierType": '
+            f'{json.dumps(self.identifier_type)}, "identifierValue": '
+        ).encode()
+        for i, instrument in enumerate(self.instruments):
+            if i:
+                body.write(b", ")
+            body.write(identifier)
+            body.write(encode_basestring_ascii(instrument).encode())
+            body.write(b"}")
+
     def _get_request_payload(self):
-        universe = self._get_universe_payload()
+        """Request payload with ``UNIVERSE_PLACEHOLDER`` in place of the
+        list of identifiers, which ``_get_request_body`` writes."""
         fieldlist = self._get_fieldlist_payload()
         request_payload = {
             "@type": "DataRequest",
             "name": self.session_id,
             "description": "BBGCLIENT",
-            "universe": {"@type": "Universe", "contains": universe},
+            "universe": {"@type": "Universe", "contains": self.UNIVERSE_PLACEHOLDER},
             "fieldList": {"@type": "DataFieldList", "contains": fieldlist},
             "trigger": {
                 "@type": "SubmitTrigger",
@@ -151,40 +423,39 @@ class Client:
                 "workStation": self.ti_workstation,
             },
         }
-        logger.debug(
-            f"Request payload created: {json.dumps(request_payload, indent=2)}"
-        )
+        if self.date_range is not None:
+            start, end = self.date_range
+            request_payload["@type"] = "HistoryRequest"
+            request_payload["fieldList"]["@type"] = "HistoryFieldList"
+            request_payload["runtimeOptions"] = {
+                "@type": "HistoryRuntimeOptions",
+                "dateRange": {
+                    "@type": "IntervalDateRange",
+                    "startDate": start.isoformat(),
+                    "endDate": end.isoformat(),
+                },
+                "period": self.history_period,
+            }
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Request payload for %d instruments: %s",
+                len(self.instruments),
+                json.dumps(request_payload, indent=2),
+            )
         return request_payload
 
-    def _get_universe_payload(self):
-        payload = [
-            self._get_universe_structure(instrument) for instrument in self.instruments
-        ]
-        return payload
-
     def _get_fieldlist_payload(self):
         payload = [
             self._get_fieldlist_structure(field)
             for field in self.fields
             if not field.startswith("@@")
         ]
-        logger.debug("Fieldlist payload: {payload}")
+        logger.debug("Fieldlist payload: %s", payload)
         return payload
 
-    def _get_universe_structure(self, id: str):
-        universe_structure = {
-            "@type": "Identifier",
-            "identifierType": self.identifier_type,
-            "identifierValue": id,
-        }
-        logger.debug(f"Universe structure for {id}: {universe_structure}")
-        return universe_structure
-
     @staticmethod
     def _get_fieldlist_structure(field):
-        field_structure = {"mnemonic": field}
-        logger.debug(f"Fieldlist structure: {field_structure}")
-        return field_structure
+        return {"mnemonic": field}
 
     @staticmethod
     def _generate_session_id():
@@ -0,0 +1,135 @@
+import hashlib
+import io
+import re
+import time
+
+import urllib3
+
+from config import logger
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-\d+/(\d+|\*)")
+_DISCARD_SIZE = 1 << 20
+
+
+class ResumableDownload(io.RawIOBase):
+    """Read-only file object over the raw (still compressed) body of a GET
+    of ``url``.
+
+    When the connection drops before ``size`` bytes (the listed size, else
+    the Content-Length) were received, the rest of the body is requested
+    with a ``Range`` header and reading carries on from the last byte
+    received, up to ``max_resumes`` times. A SHA-256 of the body is kept
+    for the log, and the transfer rate is logged once the body is complete.
+    """
+
+    RESUME_BACKOFF_SEC = 1
+
+    def __init__(self, session, url, size=None, max_resumes=3):
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.size = int(size) if size is not None else None
+        self.max_resumes = max_resumes
+        self.position = 0
+        self.resumes = 0
+        self.digest = hashlib.sha256()
+        self._response = None
+        self._complete = False
+        self._started = time.perf_counter()
+        self._open()
+        # The headers of the first response describe the whole file
+        self.headers = self._response.headers
+        if self.size is None and "Content-Length" in self.headers:
+            self.size = int(self.headers["Content-Length"])
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._complete:
+            try:
+                if self._response is None:
+                    self._open()
+                received = self._response.raw.readinto(buffer)
+            # requests' ConnectionError and Timeout are OSErrors
+            except (urllib3.exceptions.HTTPError, OSError) as e:
+                self._resume(e)
+                continue
+
+            if received:
+                self.position += received
+                self.digest.update(buffer[:received])
+                return received
+            if self.size is not None and self.position < self.size:
+                self._resume("connection closed early")
+                continue
+            if self.size is not None and self.position > self.size:
+                raise RuntimeError(
+                    f"Received {self.position} bytes from {self.url}, "
+                    f"expected {self.size}"
+                )
+            self._finish()
+        return 0
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+        super().close()
+
+    def _open(self):
+        headers = {}
+        if self.position:
+            headers["Range"] = f"bytes={self.position}-"
+        response = self.session.get(self.url, stream=True, headers=headers)
+        if self.position:
+            self._check_range(response)
+        self._response = response
+
+    def _check_range(self, response):
+        if response.status_code == 206:
+            match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            if not match or int(match.group(1)) != self.position:
+                response.close()
+                raise RuntimeError(
+                    f"Unexpected Content-Range {response.headers.get('Content-Range')}"
+                    f" resuming {self.url} at byte {self.position}"
+                )
+            return
+        # The server ignored the Range header: skip what was already received
+        logger.warning(f"Range not honoured by {self.url}, skipping received bytes")
+        remaining = self.position
+        while remaining:
+            skipped = response.raw.read(min(remaining, _DISCARD_SIZE))
+            if not skipped:
+                response.close()
+                raise RuntimeError(f"{self.url} is shorter than on the first request")
+            remaining -= len(skipped)
+
+    def _resume(self, error):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+        if self.resumes >= self.max_resumes:
+            raise RuntimeError(
+                f"Download of {self.url} interrupted at byte {self.position} "
+                f"after {self.resumes} resumes: {error}"
+            )
+        self.resumes += 1
+        logger.warning(
+            f"Download of {self.url} interrupted at byte {self.position} ({error}), "
+            f"resuming (attempt {self.resumes})"
+        )
+        time.sleep(self.RESUME_BACKOFF_SEC * 2 ** (self.resumes - 1))
+
+    def _finish(self):
+        self._complete = True
+        self._response.close()
+        self._response = None
+        elapsed = time.perf_counter() - self._started
+        rate = self.position / 2**20 / elapsed if elapsed else float("inf")
+        logger.info(
+            f"Received {self.position} bytes from {self.url} in {elapsed:.1f}s "
+            f"({rate:.1f} MB/s, {self.resumes} resumes), "
+            f"sha256 {self.digest.hexdigest()}"
+        )
@@ -0,0 +1,53 @@
+import json
+
+from config.settings import list_cast
+
+
+class Job:
+    """One field set requested for the universe returned by ``ids_query``
+    and loaded into ``output_table``."""
+
+    def __init__(self, name, fields, ids_query, output_table, ignore_columns=()):
+        self.name = name
+        self.fields = fields
+        self.ids_query = ids_query
+        self.output_table = output_table
+        self.ignore_columns = list(ignore_columns)
+
+    def __repr__(self):
+        return f"Job({self.name!r}, {len(self.fields)} fields -> {self.output_table})"
+
+    @classmethod
+    def from_dict(cls, spec):
+        missing = {"fields", "ids_query", "output_table"} - spec.keys()
+        if missing:
+            raise ValueError(f"Job {spec} is missing {', '.join(sorted(missing))}")
+        return cls(
+            name=spec.get("name", spec["output_table"]),
+            fields=cls._as_list(spec["fields"]),
+            ids_query=spec["ids_query"],
+            output_table=spec["output_table"],
+            ignore_columns=cls._as_list(spec.get("ignore_columns", [])),
+        )
+
+    @staticmethod
+    def _as_list(value):
+        # Same comma separated format as the FIELDS and IGNORE_COLUMNS settings
+        return list_cast(value) if isinstance(value, str) else list(value)
+
+
+def load_jobs(path):
+    """Read a JSON list of jobs, e.g.::
+
+    [{"name": "equities", "fields": ["PX_LAST", "CRNCY"],
+      "ids_query": "SELECT isin FROM universe", "output_table": "bbg_eq",
+      "ignore_columns": ["DL_REQUEST_ID"]}]
+    """
+    with open(path) as f:
+        specs = json.load(f)
+    jobs = [Job.from_dict(spec) for spec in specs]
+    names = [job.name for job in jobs]
+    duplicated = {name for name in names if names.count(name) > 1}
+    if duplicated:
+        raise ValueError(f"Duplicated job names in {path}: {sorted(duplicated)}")
+    return jobs
@@ -1,21 +1,19 @@
+from app import universe
 from database import mssql
 
 
 class TickerLoader:
 
-    def __init__(self, query):
-        self.df = None
+    def __init__(self, query, fetch_rows=10000):
         self.query = query
+        self.fetch_rows = fetch_rows
         self.parsed = None
 
     def fetch(self):
-        self.load_table()
-        self.parse()
-        return self.parsed
-
-    def load_table(self):
+        # Identifiers are streamed from the cursor into the normalized list,
+        # without a DataFrame of the whole result in between
         instance = mssql.MSSQLDatabase()
-        self.df = instance.select_table(self.query)
-
-    def parse(self):
-        self.parsed = list(self.df.to_dict("list").values())[0]
+        self.parsed = universe.normalize(
+            instance.iter_column(self.query, self.fetch_rows)
+        )
+        return self.parsed
@@ -0,0 +1,96 @@
+import datetime
+import json
+import os
+import threading
+import time
+
+from config import logger
+
+
+class MetadataCache:
+    """Small JSON file keeping the scheduled catalog id and the last OAuth2
+    access token between runs, so that a short scheduled run can skip the
+    catalog lookup and the token request.
+
+    Entries are kept per ``namespace`` (the OAuth2 client id). The catalog
+    id expires after ``catalog_ttl_hours``, the token shortly before its own
+    ``expires_at``. Callers invalidate an entry the server rejected (401 for
+    the token, 404 for the catalog) and fetch it again.
+    """
+
+    TOKEN_REFRESH_MARGIN_SEC = 300
+
+    def __init__(self, path, namespace, catalog_ttl_hours):
+        self.path = path
+        self.namespace = namespace
+        self.catalog_ttl = datetime.timedelta(hours=catalog_ttl_hours)
+        self._lock = threading.Lock()
+
+    def token(self):
+        token = self._entry().get("token")
+        if not token or "expires_at" not in token:
+            return None
+        if token["expires_at"] - time.time() < self.TOKEN_REFRESH_MARGIN_SEC:
+            return None
+        logger.debug("Using the cached access token")
+        return token
+
+    def store_token(self, token):
+        if "expires_at" in token:
+            self._update(token=dict(token))
+
+    def invalidate_token(self):
+        logger.info("Invalidating the cached access token")
+        self._update(token=None)
+
+    def catalog_id(self):
+        catalog = self._entry().get("catalog")
+        if not catalog:
+            return None
+        fetched_at = datetime.datetime.fromisoformat(catalog["fetched_at"])
+        if datetime.datetime.utcnow() - fetched_at > self.catalog_ttl:
+            return None
+        logger.debug(f"Using the cached catalog ID {catalog['id']}")
+        return catalog["id"]
+
+    def store_catalog(self, catalog_id):
+        fetched_at = datetime.datetime.utcnow().isoformat()
+        self._update(catalog={"id": catalog_id, "fetched_at": fetched_at})
+
+    def invalidate_catalog(self):
+        logger.info("Invalidating the cached catalog ID")
+        self._update(catalog=None)
+
+    def _entry(self):
+        with self._lock:
+            return self._read().get(self.namespace, {})
+
+    def _update(self, **values):
+        with self._lock:
+            content = self._read()
+            entry = content.setdefault(self.namespace, {})
+            for key, value in values.items():
+                if value is None:
+                    entry.pop(key, None)
+                else:
+                    entry[key] = value
+            self._write(content)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable metadata cache {self.path}: {e}")
+            return {}
+
+    def _write(self, content):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        # The file holds a bearer token: keep it private to the user
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,72 @@
+import datetime
+import json
+from urllib.parse import urljoin
+
+import sseclient
+
+from config import logger
+
+
+class NotificationListener:
+    """Wait for reply-delivery events on the Data License server-sent-events
+    notification stream instead of polling the responses listing."""
+
+    PATH = "/eap/notifications/sse"
+
+    def __init__(self, session, host, catalog_id, prefix, read_timeout=120):
+        self.session = session
+        self.url = urljoin(host, self.PATH)
+        self.catalog_id = catalog_id
+        self.prefix = prefix
+        self.read_timeout = read_timeout
+
+    def wait(self, expiration_timestamp, on_subscribed=None):
+        """Return the key of the first delivery matching the prefix, or
+        None once ``expiration_timestamp`` passes. Raises if the stream
+        cannot be opened, stalls or closes, so the caller can fall back
+        to polling.
+
+        ``on_subscribed()`` is called once the stream is open, to look for
+        a delivery made before; if it returns a true value, that value is
+        returned without waiting for an event.
+        """
+        logger.info(f"Subscribing to notifications on URL: {self.url}")
+        with self.session.get(
+            self.url,
+            stream=True,
+            headers={"Accept": "text/event-stream"},
+            timeout=(10, self.read_timeout),
+        ) as response:
+            if on_subscribed is not None:
+                delivered = on_subscribed()
+                if delivered:
+                    return delivered
+            events = sseclient.SSEClient(response.iter_content(chunk_size=1))
+            for event in events.events():
+                key = self._match(event)
+                if key:
+                    logger.info(f"Delivery notification received for key: {key}")
+                    return key
+                if datetime.datetime.utcnow() >= expiration_timestamp:
+                    return None
+
+        raise ConnectionError("Notification stream closed by the server")
+
+    def _match(self, event):
+        if not event.data or event.event == "heartbeat":
+            return None
+        try:
+            notification = json.loads(event.data)
+        except ValueError:
+            logger.debug("Ignoring non-JSON notification: %s", event.data)
+            return None
+
+        generated = notification.get("generated", notification)
+        key = generated.get("key")
+        if not key or not key.startswith(self.prefix):
+            return None
+
+        catalog = generated.get("snapshot", {}).get("dataset", {}).get("catalog", {})
+        if str(catalog.get("identifier", self.catalog_id)) != str(self.catalog_id):
+            return None
+        return key
@@ -0,0 +1,114 @@
+import queue
+import threading
+
+from config import logger
+
+_DONE = object()
+
+
+class Pipeline:
+    """Run a source, a chain of steps and a sink concurrently.
+
+    Every item produced by ``source`` goes through ``steps`` one at a time,
+    each step running in its own thread, and the results are handed to
+    ``sink`` as an iterable while the source is still producing. The stages
+    are connected by queues of at most ``queue_size`` items, so a slow stage
+    holds back the ones before it instead of letting items pile up.
+
+    The first error raised by any stage stops the others and is re-raised by
+    ``run``.
+    """
+
+    POLL_INTERVAL_SEC = 0.1
+
+    def __init__(self, source, steps, queue_size=4):
+        self.source = source
+        self.steps = steps
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def run(self, sink):
+        """Feed the processed items to ``sink`` and return its result."""
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.steps) + 1)]
+        threads = [
+            threading.Thread(
+                target=self._guard, args=(self._feed, queues[0]), name="pipeline-0"
+            )
+        ]
+        for position, step in enumerate(self.steps):
+            threads.append(
+                threading.Thread(
+                    target=self._guard,
+                    args=(self._work, step, queues[position], queues[position + 1]),
+                    name=f"pipeline-{position + 1}",
+                )
+            )
+        for thread in threads:
+            thread.start()
+
+        try:
+            return sink(self._drain(queues[-1]))
+        except BaseException as e:
+            self._fail(e)
+            raise
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _guard(self, target, *args):
+        try:
+            target(*args)
+        except BaseException as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+                logger.error(f"Pipeline stopped: {error!r}")
+        self._stop.set()
+
+    def _feed(self, outbound):
+        source = iter(self.source)
+        try:
+            for item in source:
+                if not self._put(outbound, item):
+                    return
+            self._put(outbound, _DONE)
+        finally:
+            # Let a generator release what it holds, e.g. an HTTP stream
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+
+    def _work(self, step, inbound, outbound):
+        while (item := self._get(inbound)) is not _DONE:
+            if not self._put(outbound, step(item)):
+                return
+        self._put(outbound, _DONE)
+
+    def _drain(self, inbound):
+        while (item := self._get(inbound)) is not _DONE:
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, outbound, item):
+        while not self._stop.is_set():
+            try:
+                outbound.put(item, timeout=self.POLL_INTERVAL_SEC)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, inbound):
+        while not self._stop.is_set():
+            try:
+                return inbound.get(timeout=self.POLL_INTERVAL_SEC)
+            except queue.Empty:
+                continue
+        return _DONE
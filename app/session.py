@@ -1,46 +1,144 @@
 import datetime
+import logging
+import threading
+import time
 
 from oauthlib.oauth2 import BackendApplicationClient, TokenExpiredError
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth2Session
-
-from config import logger
+from urllib3.util.retry import Retry
+
+from config import logger, recorder, settings
+
+
+class HTTPError(RuntimeError):
+    """Unexpected response status, with the response attached."""
+
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
+
+class RetryPolicy(Retry):
+    """urllib3 retry policy: exponential backoff with jitter, honouring
+    Retry-After. A POST is only retried on 429 and 503, which tell that the
+    request was not processed, so that a DataRequest is never submitted
+    twice."""
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    POST_RETRY_STATUSES = frozenset({429, 503})
+    BACKOFF_JITTER_SEC = 1.0
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == "POST":
+            return bool(self.total) and status_code in self.POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+    @classmethod
+    def build(cls, max_retries, backoff_factor):
+        return cls(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            # Read errors are only retried for these, POST could be replayed
+            allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+            status_forcelist=cls.RETRY_STATUSES,
+            backoff_factor=backoff_factor,
+            backoff_jitter=cls.BACKOFF_JITTER_SEC,
+            raise_on_status=False,
+        )
 
 
 class Session(OAuth2Session):
     """Session class for making requests to a DL REST API
     using OAuth2 authentication."""
 
-    def __init__(self, client_secret, *args, **kwargs):
+    OAUTH2_ENDPOINT = "https://bsso.blpprofessional.com/ext/api/as/token.oauth2"
+    TOKEN_REFRESH_MARGIN_SEC = 60
+    CONNECT_TIMEOUT_SEC = 10
+
+    def __init__(self, client_secret, *args, metadata_cache=None, **kwargs):
         """
         Initialize a Session instance.
         """
         self.client_secret = client_secret
+        self.metadata_cache = metadata_cache
+        self.timeout = (self.CONNECT_TIMEOUT_SEC, settings.REQUEST_TIMEOUT_SEC)
+        self._token_lock = threading.Lock()
         super().__init__(*args, **kwargs)
+        # Connections are kept alive and shared by the threads of sharded
+        # requests and job runs
+        adapter = HTTPAdapter(
+            pool_connections=settings.HTTP_POOL_SIZE,
+            pool_maxsize=settings.HTTP_POOL_SIZE,
+            max_retries=RetryPolicy.build(
+                settings.REQUEST_MAX_RETRIES, settings.REQUEST_BACKOFF_FACTOR
+            ),
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def use_cached_token(self):
+        """Reuse the access token of a previous run if it is still valid."""
+        token = self.metadata_cache.token() if self.metadata_cache else None
+        if token is None:
+            return False
+        self.token = token
+        return True
 
     def request_token(self):
         """
         Fetch an OAuth2 access token by making a request to the token endpoint.
         """
-        oauth2_endpoint = "https://bsso.blpprofessional.com/ext/api/as/token.oauth2"
-        self.token = self.fetch_token(
-            token_url=oauth2_endpoint,
-            client_secret=self.client_secret,
-        )
+        with recorder.stage("token"):
+            self.token = self.fetch_token(
+                token_url=self.OAUTH2_ENDPOINT,
+                client_secret=self.client_secret,
+            )
+        if self.metadata_cache:
+            self.metadata_cache.store_token(self.token)
 
-    def request(self, *args, **kwargs):
+    def request(self, method, url, *args, **kwargs):
         """
-        Override the parent class method to handle TokenExpiredError
-        by refreshing the token.
+        Override the parent class method to refresh the token shortly before
+        it expires, and to handle TokenExpiredError and a 401 for a token the
+        server no longer accepts by refreshing it.
         :return: response object from the API request
         """
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if url == self.OAUTH2_ENDPOINT:
+            return super().request(method, url, *args, **kwargs)
+
+        self._refresh_expiring_token()
         try:
-            response = super().request(*args, **kwargs)
+            response = super().request(method, url, *args, **kwargs)
         except TokenExpiredError:
             self.request_token()
-            response = super().request(*args, **kwargs)
+            response = super().request(method, url, *args, **kwargs)
+        except HTTPError as e:
+            if e.response.status_code != 401:
+                raise
+            logger.warning("Access token rejected, requesting a new one")
+            if self.metadata_cache:
+                self.metadata_cache.invalidate_token()
+            self.request_token()
+            response = super().request(method, url, *args, **kwargs)
 
         return response
 
+    def _refresh_expiring_token(self):
+        expires_at = (self.token or {}).get("expires_at")
+        if expires_at is None:
+            return
+        with self._token_lock:
+            # Another thread may have refreshed it while this one waited
+            expires_at = self.token.get("expires_at", expires_at)
+            if expires_at - time.time() < self.TOKEN_REFRESH_MARGIN_SEC:
+                logger.info("Access token about to expire, refreshing it")
+                self.request_token()
+
     def send(self, request, **kwargs):
         """
         Override the parent class method to log request and response information.
@@ -53,23 +151,54 @@ class Session(OAuth2Session):
             request.url,
         )
 
-        response = super().send(request, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            recorder.record_http(
+                request.method, request.url, None, time.perf_counter() - start, 0
+            )
+            raise
+        recorder.record_http(
+            request.method,
+            request.url,
+            response.status_code,
+            time.perf_counter() - start,
+            self._response_size(response, kwargs.get("stream")),
+        )
 
         logger.debug("Response status: %s", response.status_code)
         logger.debug("Response x-request-id: %s", response.headers.get("x-request-id"))
 
         if response.ok:
-            if not kwargs.get("stream"):
+            # Decoding the body is only worth it when it gets logged
+            if not kwargs.get("stream") and logger.isEnabledFor(logging.DEBUG):
                 logger.debug("Response content: %s", response.text)
         else:
-            raise RuntimeError(
+            raise HTTPError(
                 "\n\tUnexpected response status code: {c}\nDetails: {r}".format(
-                    c=str(response.status_code), r=response.json()
-                )
+                    c=str(response.status_code), r=self._details(response)
+                ),
+                response,
             )
 
         return response
 
+    @staticmethod
+    def _details(response):
+        # Gateways answer 401/5xx with HTML or an empty body
+        try:
+            return response.json()
+        except ValueError:
+            return response.text
+
+    @staticmethod
+    def _response_size(response, stream):
+        # Reading the content of a streamed response would consume it
+        if stream:
+            return int(response.headers.get("content-length", 0))
+        return len(response.content)
+
 
 def check_credentials(credentials):
     expires_in = (
@@ -82,10 +211,15 @@ def check_credentials(credentials):
         logger.warning("Credentials expiring in %s", expires_in)
 
 
-def get_session(credentials):
+def get_session(credentials, metadata_cache=None):
     check_credentials(credentials)
     client = BackendApplicationClient(client_id=credentials["client_id"])
-    session = Session(client_secret=credentials["client_secret"], client=client)
+    session = Session(
+        client_secret=credentials["client_secret"],
+        client=client,
+        metadata_cache=metadata_cache,
+    )
     session.headers["api-version"] = "2"
-    session.request_token()
+    if not session.use_cached_token():
+        session.request_token()
     return session
@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from app.cache import request_fingerprint
+from app.client import Client
+from config import logger
+
+
+class ShardedClient:
+    """Split the universe into shards submitted as separate DataRequests
+    under one session, then listen for and download them in parallel.
+
+    Exposes the same ``data_request``/``listen``/``listen_chunks`` interface
+    as ``Client``. Shards that fail or time out are resubmitted on their own
+    up to ``max_retries`` times.
+    """
+
+    ORDER_COLUMN = "IDENTIFIER"
+
+    def __init__(
+        self,
+        instruments: list,
+        shard_size: int,
+        concurrency: int,
+        max_retries: int,
+        catalog_id: str = None,
+        **client_kwargs,
+    ):
+        if shard_size < 1:
+            raise ValueError(f"Invalid shard size: {shard_size}")
+
+        self.instruments = instruments
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.client_kwargs = client_kwargs
+        self.shards = list(self._split(instruments, shard_size))
+        self.catalog_id = catalog_id
+        self.output_key = None
+        self.clients = [self._new_client(self.shards[0])]
+        self.catalog_id = self.clients[0].catalog_id
+        self.clients += [self._new_client(shard) for shard in self.shards[1:]]
+        logger.info(
+            f"Universe of {len(instruments)} instruments split into "
+            f"{len(self.shards)} shards of up to {shard_size}"
+        )
+
+    @property
+    def request_id(self):
+        """Request IDs of the submitted shards, separated by commas."""
+        ids = [client.request_id for client in self.clients if client.request_id]
+        return ",".join(ids) or None
+
+    def data_request(self):
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            futures = {
+                executor.submit(client.data_request): i
+                for i, client in enumerate(self.clients)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(
+                        f"Shard {futures[future]} request failed, "
+                        f"will be resubmitted: {e}"
+                    )
+
+    def listen(self, chunk_size=None):
+        frames = [None] * len(self.shards)
+        pending = list(range(len(self.shards)))
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                logger.info(f"Retrying shards {pending} (attempt {attempt})")
+            pending = self._collect(pending, frames, chunk_size)
+            if not pending:
+                break
+        else:
+            raise RuntimeError(
+                f"Shards {pending} failed after {self.max_retries} retries"
+            )
+
+        self.output_key = f"{self.clients[0].output_key}+{len(self.clients) - 1}"
+        return self._merge(frames)
+
+    def ready(self):
+        # Shards whose submission failed are resubmitted by listen
+        return all(
+            client.request_id is None or client.ready() for client in self.clients
+        )
+
+    def checkpoint_state(self):
+        return {
+            "catalog_id": self.catalog_id,
+            "shards": [client.checkpoint_state() for client in self.clients],
+        }
+
+    def resume(self, state):
+        shards = state["shards"]
+        if len(shards) != len(self.clients):
+            raise ValueError(
+                f"Checkpoint has {len(shards)} shards, expected {len(self.clients)}"
+            )
+        for client, shard_state in zip(self.clients, shards):
+            client.resume(shard_state)
+
+    def fingerprint(self):
+        client = self.clients[0]
+        return request_fingerprint(
+            self.instruments,
+            client.fields,
+            client.identifier_type,
+            client.ti_usernumber,
+            client.ti_serialnumber,
+            client.ti_workstation,
+            date_range=client.date_range,
+        )
+
+    def listen_chunks(self, chunk_size):
+        df = self.listen(chunk_size)
+        if df is not None:
+            yield df
+
+    def _collect(self, pending, frames, chunk_size):
+        failed = []
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            futures = {
+                executor.submit(self._receive, i, chunk_size): i for i in pending
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    frames[i] = future.result()
+                    logger.info(f"Shard {i} received: {len(frames[i])} rows")
+                except Exception as e:
+                    logger.error(f"Shard {i} failed: {e}")
+                    self.clients[i].request_id = None
+                    failed.append(i)
+
+        return sorted(failed)
+
+    def _receive(self, i, chunk_size):
+        client = self.clients[i]
+        if client.request_id is None:
+            client = self.clients[i] = self._new_client(self.shards[i])
+            client.data_request()
+
+        if chunk_size:
+            chunks = list(client.listen_chunks(chunk_size))
+            df = pd.concat(chunks, ignore_index=True) if chunks else None
+        else:
+            df = client.listen()
+        if df is None:
+            raise RuntimeError(f"No response received for request {client.request_id}")
+        return df
+
+    def _merge(self, frames):
+        df = pd.concat(frames, ignore_index=True)
+        if self.ORDER_COLUMN in df.columns:
+            order = {}
+            for i, instrument in enumerate(self.instruments):
+                order.setdefault(instrument, i)
+            position = df[self.ORDER_COLUMN].map(order).fillna(len(order))
+            df = df.iloc[position.argsort(kind="stable")].reset_index(drop=True)
+        return df
+
+    @staticmethod
+    def _split(instruments, shard_size):
+        for start in range(0, len(instruments), shard_size):
+            stop = start + shard_size
+            yield instruments[start:stop]
+
+    def _new_client(self, shard):
+        return Client(
+            instruments=shard,
+            catalog_id=self.catalog_id,
+            **self.client_kwargs,
+        )
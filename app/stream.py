@@ -0,0 +1,76 @@
+import codecs
+import io
+import json
+
+READ_SIZE = 1 << 20
+_SEPARATORS = " \t\r\n,"
+
+
+def iter_records(fileobj, read_size=READ_SIZE):
+    """Yield the raw JSON text of every record of a top-level JSON array.
+
+    The array is decoded incrementally from ``fileobj`` so that only the
+    current read buffer and the record being parsed are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos = "", 0
+    opened, eof = False, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+            pos += 1
+
+        if pos < len(buffer):
+            if not opened:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array of records")
+                opened = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                _, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield buffer[pos:end]
+                pos = end
+                continue
+        elif eof:
+            if opened:
+                raise ValueError("Unexpected end of JSON array")
+            return
+
+        chunk = fileobj.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+
+def iter_frames(fileobj, chunk_size, read_size=READ_SIZE):
+    """Yield DataFrames of at most ``chunk_size`` records parsed from
+    a JSON array of records.
+
+    Every chunk goes through ``pd.read_json`` so dtype inference matches
+    the one applied to a fully buffered response.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"Invalid chunk size: {chunk_size}")
+
+    records = []
+    for record in iter_records(fileobj, read_size):
+        records.append(record)
+        if len(records) == chunk_size:
+            yield _to_frame(records)
+            records = []
+
+    if records:
+        yield _to_frame(records)
+
+
+def _to_frame(records):
+    import pandas as pd
+
+    return pd.read_json(io.StringIO(f"[{','.join(records)}]"))
@@ -0,0 +1,42 @@
+import datetime
+
+from config import logger
+
+
+def normalize(identifiers):
+    """Strip identifiers and collapse their inner whitespace, dropping
+    blanks and duplicates; the first occurrence keeps its position.
+    ``identifiers`` can be any iterable, it is only read once."""
+    normalized = {}
+    read = 0
+    for read, identifier in enumerate(identifiers, 1):
+        # NULLs read from the database come back as None or NaN
+        if identifier is None or identifier != identifier:
+            continue
+        identifier = " ".join(str(identifier).split())
+        if identifier:
+            normalized.setdefault(identifier, None)
+
+    dropped = read - len(normalized)
+    if dropped:
+        logger.info(f"Dropped {dropped} blank or duplicated identifiers")
+    return list(normalized)
+
+
+def pending(instruments, refreshed, max_age_hours, now=None):
+    """Instruments of ``instruments`` missing from ``refreshed``, a mapping
+    of identifiers to their last successful refresh, or refreshed more than
+    ``max_age_hours`` before ``now`` (UTC)."""
+    cutoff = (now or datetime.datetime.utcnow()) - datetime.timedelta(
+        hours=max_age_hours
+    )
+    latest = {}
+    for identifier, refreshed_at in refreshed.items():
+        if identifier is None or refreshed_at is None:
+            continue
+        latest[" ".join(str(identifier).split())] = refreshed_at
+    return [
+        instrument
+        for instrument in instruments
+        if instrument not in latest or latest[instrument] < cutoff
+    ]
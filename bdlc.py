@@ -0,0 +1,225 @@
+"""Run the pipeline one step at a time, each in its own short-lived process.
+
+``submit`` sends the request and records it in the checkpoint, ``collect``
+downloads the response once it is delivered, ``transform`` and ``load``
+write it to the output table; ``run`` does all of it in one process like
+``main.py``. Each step only imports the modules and checks the settings it
+needs, so the Bloomberg wait can be spent between cheap ``collect --no-wait``
+invocations instead of in an idle process.
+"""
+
+import argparse
+import importlib
+import sys
+import time
+
+from config import logger, recorder, settings
+
+# Exit status of ``collect --no-wait`` while the response is not delivered
+EX_TEMPFAIL = 75
+
+STEP_MODULES = {
+    "submit": ("main", "database.mssql"),
+    "collect": ("main",),
+    "transform": ("main", "transformer", "transformer.schema"),
+    "load": ("main", "database.mssql", "sinks"),
+    "run": ("main", "database.mssql", "transformer", "sinks"),
+}
+
+STEP_SETTINGS = {
+    "submit": (
+        *settings.BLOOMBERG,
+        *settings.MSSQL,
+        "DB_IDS_QUERY",
+        "FIELDS",
+        "CHECKPOINT_PATH",
+    ),
+    "collect": (*settings.BLOOMBERG, "CHECKPOINT_PATH"),
+    "transform": ("CHECKPOINT_PATH",),
+    "load": (*settings.MSSQL, "OUTPUT_TABLE", "CHECKPOINT_PATH"),
+    "run": (
+        *settings.BLOOMBERG,
+        *settings.MSSQL,
+        "DB_IDS_QUERY",
+        "FIELDS",
+        "OUTPUT_TABLE",
+    ),
+}
+
+
+def import_modules(step):
+    start = time.perf_counter()
+    with recorder.stage("import"):
+        for name in STEP_MODULES[step]:
+            importlib.import_module(name)
+    logger.info(f"Imported the {step} modules in {time.perf_counter() - start:.2f}s")
+
+
+def load_state(checkpoint, previous_step, ready=lambda state: True):
+    """State of the request in the checkpoint, once ``previous_step`` is
+    done with it."""
+    state = checkpoint.current()
+    if state is None or not ready(state):
+        raise RuntimeError(
+            f"Nothing to process in {checkpoint.path}, run bdlc {previous_step} first"
+        )
+    return state
+
+
+def load_universe():
+    import main
+
+    if settings.INCREMENTAL_UNIVERSE:
+        settings.require("OUTPUT_TABLE")
+    instruments = main.load_tickers()
+    if settings.INCREMENTAL_UNIVERSE:
+        from database.mssql import MSSQLDatabase
+
+        instruments = main.select_universe(
+            instruments, settings.OUTPUT_TABLE, MSSQLDatabase()
+        )
+    return instruments
+
+
+def submit(args):
+    import main
+
+    instruments = load_universe()
+    if not instruments:
+        logger.info("Universe up to date, nothing to request")
+        return
+    checkpoint = main.init_checkpoint()
+    state = checkpoint.load(main.fingerprint(instruments))
+    if state and state["stage"] != checkpoint.SUBMITTED:
+        logger.info(f"Request already at stage '{state['stage']}'")
+        return
+    main.submit_request(instruments, checkpoint, state)
+
+
+def collect(args):
+    import main
+
+    checkpoint = main.init_checkpoint()
+    state = load_state(checkpoint, "submit")
+    if state["stage"] != checkpoint.SUBMITTED:
+        logger.info(f"Response already collected at stage '{state['stage']}'")
+        return
+    instruments = []
+    if "shards" in state["client"]:
+        # The checkpoint does not keep the universe, which a sharded request
+        # needs to resubmit a failed shard and to order the rows
+        settings.require(*settings.MSSQL, "DB_IDS_QUERY")
+        instruments = load_universe()
+        if main.fingerprint(instruments) != state["fingerprint"]:
+            raise RuntimeError(
+                "The universe changed since the request was submitted, "
+                "run bdlc submit again"
+            )
+    client = main.init_client(
+        instruments,
+        catalog_id=state["client"]["catalog_id"],
+        fields=state["fields"],
+    )
+    client.resume(state["client"])
+    if not args.wait and not client.ready():
+        logger.info(f"Response not delivered yet, exiting with {EX_TEMPFAIL}")
+        return EX_TEMPFAIL
+
+    df = main.receive_data(client)
+    if df is None:
+        raise RuntimeError("No data received from Bloomberg API")
+    cache = main.init_cache()
+    if cache is not None:
+        cache.store(state["fingerprint"], client.output_key, df, client.request_id)
+    checkpoint.mark_downloaded(df)
+
+
+def transform(args):
+    import main
+    from transformer import Agent
+
+    checkpoint = main.init_checkpoint()
+    state = load_state(
+        checkpoint, "collect", lambda state: state["stage"] == checkpoint.DOWNLOADED
+    )
+    with recorder.stage("transform") as metrics:
+        agent = Agent(
+            checkpoint.load_data(), settings.IGNORE_COLUMNS, fields=state["fields"]
+        )
+        df = agent.transform()
+        metrics["rows"] = len(df)
+    df, sql_types = main.compact_data(df)
+    checkpoint.mark_transformed(df, sql_types)
+    logger.info(f"Transformed {len(df)} rows")
+
+
+def load(args):
+    import main
+    from database.mssql import MSSQLDatabase
+
+    checkpoint = main.init_checkpoint()
+    state = load_state(checkpoint, "transform", lambda state: "transformed_at" in state)
+    df = checkpoint.load_transformed()
+    if df.empty:
+        logger.warning("Transformed DataFrame is empty, nothing to load")
+    else:
+        main.write_data(MSSQLDatabase(), df, state["sql_types"])
+    checkpoint.clear()
+    logger.info("Processing complete")
+
+
+def run(args):
+    import main
+
+    main.main(from_cache=args.from_cache)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="bdlc", description="Bloomberg Data License Client"
+    )
+    steps = parser.add_subparsers(dest="step", required=True)
+
+    step = steps.add_parser(
+        "submit", help="send the data request and record it in CHECKPOINT_PATH"
+    )
+    step.set_defaults(func=submit)
+
+    step = steps.add_parser(
+        "collect", help="download the response of the submitted request"
+    )
+    step.add_argument(
+        "--no-wait",
+        dest="wait",
+        action="store_false",
+        help=f"check once and exit with {EX_TEMPFAIL} if it is not delivered yet",
+    )
+    step.set_defaults(func=collect)
+
+    step = steps.add_parser("transform", help="transform the collected response")
+    step.set_defaults(func=transform)
+
+    step = steps.add_parser(
+        "load", help="write the transformed response to the output table"
+    )
+    step.set_defaults(func=load)
+
+    step = steps.add_parser("run", help="run every step in this process")
+    step.add_argument(
+        "--from-cache",
+        action="store_true",
+        help="replay the latest cached response instead of requesting Bloomberg",
+    )
+    step.set_defaults(func=run)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        settings.require(*STEP_SETTINGS[args.step])
+        import_modules(args.step)
+        status = args.func(args)
+    finally:
+        recorder.emit()
+    sys.exit(status)
@@ -0,0 +1,28 @@
+"""Offline benchmarks for the bdlc pipeline stages.
+
+Placeholder values are provided for the settings without a default, so
+that none of the modules a benchmark uses fails on a missing one.
+Logging defaults to WARNING so that it does not skew the measurements.
+"""
+
+import os
+
+PLACEHOLDER_SETTINGS = {
+    "LOG_LEVEL": "WARNING",
+    "CREDENTIALS": '{"client_id": "bench", "client_secret": "bench", "expiration_date": 4102444800000}',  # noqa: E501
+    "TI_USERNUMBER": "0",
+    "TI_SERIALNUMBER": "0",
+    "TI_WORKSTATION": "0",
+    "IDENTIFIER_TYPE": "ISIN",
+    "DB_IDS_QUERY": "SELECT 1",
+    "FIELDS": "LAST_UPDATE,LAST_UPDATE_DT,LAST_TRADE_DATE,LAST_TRADE_TIME",
+    "IGNORE_COLUMNS": "LAST_UPDATE_DT,LAST_TRADE_DATE,LAST_TRADE_TIME",
+    "OUTPUT_TABLE": "bench",
+    "MSSQL_SERVER": "bench",
+    "MSSQL_DATABASE": "bench",
+    "MSSQL_USERNAME": "bench",
+    "MSSQL_PASSWORD": "bench",
+}
+
+for name, value in PLACEHOLDER_SETTINGS.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,91 @@
+"""Compare the row-wise and vectorized date normalization of ``Agent``.
+
+Usage: python -m benchmark.dates [--rows 1000000] [--seed 0]
+"""
+
+import argparse
+import json
+import time
+
+import benchmark  # noqa: F401
+import numpy as np
+import pandas as pd
+
+from transformer import Agent
+
+
+def synthetic_frame(rows, seed=0):
+    """Build a frame mixing the LAST_UPDATE layouts Bloomberg delivers:
+    a time of day with LAST_UPDATE_DT, a full timestamp, a %Y%m%d date,
+    and missing values that fall back to LAST_TRADE_DATE/LAST_TRADE_TIME.
+    """
+    rng = np.random.default_rng(seed)
+    moments = np.datetime64("2024-01-01T00:00:00") + rng.integers(
+        0, 365 * 86400, rows
+    ).astype("timedelta64[s]")
+    stamps = pd.Series(moments)
+    day = stamps.dt.strftime("%Y-%m-%d")
+    clock = stamps.dt.strftime("%H:%M:%S")
+    micros = pd.Series(rng.integers(0, 10**6, rows)).astype(str).str.zfill(6)
+
+    kind = rng.integers(0, 5, rows)
+    last_update = np.select(
+        [kind == 0, kind == 1, kind == 2],
+        [clock, day + " " + clock, stamps.dt.strftime("%Y%m%d")],
+        default=None,
+    )
+    last_update_dt = np.where(kind <= 1, day, None)
+    trade_time = np.where(kind == 3, clock + "." + micros, clock)
+    trade_time = np.where(rng.random(rows) < 0.05, None, trade_time)
+
+    return pd.DataFrame(
+        {
+            "LAST_UPDATE": last_update,
+            "LAST_UPDATE_DT": last_update_dt,
+            "LAST_TRADE_DATE": day,
+            "LAST_TRADE_TIME": trade_time,
+        }
+    )
+
+
+def run(df, vectorized):
+    agent = Agent(df.copy(), [], vectorized_dates=vectorized)
+    start = time.perf_counter()
+    agent.reformat_date_columns()
+    return agent.df, time.perf_counter() - start
+
+
+def as_datetimes(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype("datetime64[ns]")
+    text = series.map(lambda v: None if v is None else str(v))
+    return pd.to_datetime(text, format="%Y-%m-%d %H:%M:%S", errors="coerce").astype(
+        "datetime64[ns]"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows, args.seed)
+    rowwise, rowwise_sec = run(df, vectorized=False)
+    vectorized, vectorized_sec = run(df, vectorized=True)
+    equal = all(
+        as_datetimes(rowwise[column]).equals(as_datetimes(vectorized[column]))
+        for column in ("LAST_UPDATE", "timestamp_read_utc")
+    )
+    report = {
+        "rows": args.rows,
+        "rowwise_sec": round(rowwise_sec, 3),
+        "vectorized_sec": round(vectorized_sec, 3),
+        "speedup": round(rowwise_sec / vectorized_sec, 1),
+        "equal": equal,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
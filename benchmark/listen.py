@@ -0,0 +1,69 @@
+"""Measure how long ``Client.listen`` takes to notice a delivery.
+
+Usage: python -m benchmark.listen [--delay 3] [--poll-interval 10]
+
+Runs the listener against the local stand-in server in polling mode, in
+SSE mode, and in SSE mode with the notification stream dropped before the
+delivery, which exercises the fallback to polling.
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import benchmark  # noqa: F401
+from benchmark.server import DataLicenseStub, stub_client
+
+RECORDS = [{"IDENTIFIER": "US0000000001", "PX_LAST": 1.0}]
+
+
+def measure(stub, mode, delay, poll_interval, drop_stream=False):
+    client = stub_client(
+        stub,
+        ["US0000000001"],
+        ["PX_LAST"],
+        listen_mode=mode,
+        poll_interval_min=poll_interval,
+        poll_interval_max=poll_interval,
+    )
+    client.data_request()
+
+    def deliver():
+        if drop_stream:
+            stub.drop_streams()
+        stub.deliver(
+            f"{client.session_id}.json.gz", RECORDS, request_id=client.request_id
+        )
+
+    start = time.perf_counter()
+    timer = threading.Timer(delay, deliver)
+    timer.start()
+    df = client.listen()
+    elapsed = time.perf_counter() - start
+    timer.join()
+    return {
+        "mode": mode if not drop_stream else f"{mode}-dropped",
+        "received": df is not None and len(df) == len(RECORDS),
+        "wall_sec": round(elapsed, 3),
+        "latency_sec": round(elapsed - delay, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delay", type=float, default=3)
+    parser.add_argument("--poll-interval", type=int, default=10)
+    args = parser.parse_args()
+
+    with DataLicenseStub(heartbeat_sec=0.5) as stub:
+        results = [
+            measure(stub, "poll", args.delay, args.poll_interval),
+            measure(stub, "sse", args.delay, args.poll_interval),
+            measure(stub, "sse", args.delay, args.poll_interval, drop_stream=True),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Synthetic Data License responses for N instruments x M fields."""
+
+import datetime
+import random
+import string
+
+METADATA_COLUMNS = [
+    "DL_REQUEST_ID",
+    "DL_REQUEST_NAME",
+    "DL_SNAPSHOT_START_TIME",
+    "DL_SNAPSHOT_TZ",
+    "IDENTIFIER",
+    "RC",
+]
+DATE_FIELDS = ["LAST_UPDATE", "LAST_UPDATE_DT", "LAST_TRADE_DATE", "LAST_TRADE_TIME"]
+TEXT_FIELDS = ["CRNCY", "EXCH_CODE", "SECURITY_TYP", "NAME"]
+CURRENCIES = ["USD", "EUR", "GBP", "CHF", "JPY"]
+EXCHANGES = ["US", "LN", "GR", "SW", "JT", "FP"]
+SECURITY_TYPES = ["Common Stock", "ETP", "REIT", "ADR", "Corp"]
+
+
+def synthetic_universe(size, seed=0):
+    """ISIN-like identifiers."""
+    rng = random.Random(seed)
+    alphabet = string.ascii_uppercase + string.digits
+    return [
+        f"{rng.choice(['US', 'GB', 'DE', 'CH'])}"
+        f"{''.join(rng.choices(alphabet, k=9))}{i % 10}"
+        for i in range(size)
+    ]
+
+
+def synthetic_fields(size):
+    """The date and text fields ``Agent`` relies on, padded with numeric
+    fields up to ``size`` fields."""
+    fields = DATE_FIELDS + TEXT_FIELDS
+    fields += [f"PX_FIELD_{i:03d}" for i in range(max(0, size - len(fields)))]
+    return fields
+
+
+def synthetic_records(instruments, fields, request_id="r1", name="bench", seed=0):
+    """Yield one response record per instrument with realistic values:
+    LAST_UPDATE alternates between a time of day, a full timestamp and a
+    %Y%m%d date, numbers are sent as strings as Bloomberg does."""
+    rng = random.Random(seed)
+    snapshot = datetime.datetime(2024, 6, 28, 22, 0, 0)
+    for i, instrument in enumerate(instruments):
+        moment = snapshot - datetime.timedelta(seconds=rng.randrange(5 * 86400))
+        record = {
+            "DL_REQUEST_ID": request_id,
+            "DL_REQUEST_NAME": name,
+            "DL_SNAPSHOT_START_TIME": snapshot.isoformat(),
+            "DL_SNAPSHOT_TZ": "UTC",
+            "IDENTIFIER": instrument,
+            "RC": 0,
+        }
+        for field in fields:
+            record[field] = _value(field, i, moment, rng)
+        yield record
+
+
+def _value(field, i, moment, rng):
+    if field == "LAST_UPDATE":
+        layout = i % 4
+        if layout == 0:
+            return moment.strftime("%H:%M:%S")
+        if layout == 1:
+            return moment.strftime("%Y-%m-%d %H:%M:%S")
+        if layout == 2:
+            return moment.strftime("%Y%m%d")
+        return None
+    if field in ("LAST_UPDATE_DT", "LAST_TRADE_DATE"):
+        return moment.strftime("%Y-%m-%d")
+    if field == "LAST_TRADE_TIME":
+        return moment.strftime("%H:%M:%S.%f")
+    if field == "CRNCY":
+        return rng.choice(CURRENCIES)
+    if field == "EXCH_CODE":
+        return rng.choice(EXCHANGES)
+    if field == "SECURITY_TYP":
+        return rng.choice(SECURITY_TYPES)
+    if field == "NAME":
+        return f"INSTRUMENT {i}"
+    if rng.random() < 0.02:
+        return None
+    return f"{rng.uniform(0, 1000):.4f}"
@@ -0,0 +1,146 @@
+"""End-to-end benchmark of the pipeline against local stand-ins.
+
+Usage: python -m benchmark.pipeline [--instruments 10000] [--fields 50]
+       [--turnaround 0] [--vectorized-dates] [--compact-dtypes]
+       [--pipelined CHUNK_ROWS] [--output report.json]
+
+Runs token, catalog lookup, submission, Bloomberg turnaround, download and
+parse, ``Agent.transform`` and the insert against ``benchmark.server`` and an
+in-memory SQLite sink, and reports the ``config.metrics`` run summary (wall
+time, throughput and peak RSS per stage and per HTTP endpoint) as JSON that
+can be compared between versions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+
+import benchmark  # noqa: F401
+import pandas as pd
+
+from app.pipeline import Pipeline
+from benchmark.payload import synthetic_fields, synthetic_records, synthetic_universe
+from benchmark.server import DataLicenseStub, stub_client, stub_session
+from benchmark.sink import SQLiteSink
+from config import recorder, settings
+from transformer import Agent, schema
+
+
+def run(
+    instruments,
+    fields,
+    turnaround_sec,
+    vectorized_dates=False,
+    compact_dtypes=False,
+    pipelined_chunk_rows=0,
+):
+    settings.FIELDS = fields
+    recorder.reset()
+
+    def responder(payload, request_id):
+        return synthetic_records(
+            instruments, fields, request_id=request_id, name=payload["name"]
+        )
+
+    def transform(df):
+        with recorder.stage("transform") as metrics:
+            df = Agent(df, [], vectorized_dates=vectorized_dates).transform()
+            metrics["rows"] = len(df)
+        return df
+
+    sink = SQLiteSink()
+    # The client records token, catalog, submit, turnaround, download and
+    # parse itself; SSE keeps the turnaround free of polling delays.
+    with DataLicenseStub(responder=responder, turnaround_sec=turnaround_sec) as stub:
+        session = stub_session(stub)
+        client = stub_client(
+            stub, instruments, fields, session=session, listen_mode="sse"
+        )
+        client.data_request()
+        if pipelined_chunk_rows:
+            pipeline = Pipeline(client.listen_chunks(pipelined_chunk_rows), [transform])
+            with recorder.stage("pipeline") as metrics:
+                metrics["rows"] = pipeline.run(
+                    lambda chunks: sink.insert_chunks(chunks, "bench")
+                )
+        else:
+            df = transform(client.listen())
+
+    if not pipelined_chunk_rows:
+        if compact_dtypes:
+            with recorder.stage("schema") as metrics:
+                df, _ = schema.infer(df)
+                metrics["rows"] = len(df)
+
+        with recorder.stage("insert") as metrics:
+            sink.insert_table(df, "bench")
+            metrics["rows"] = sink.count("bench")
+    sink.close()
+
+    return recorder.summary()
+
+
+def version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instruments", type=int, default=10000)
+    parser.add_argument("--fields", type=int, default=50)
+    parser.add_argument("--turnaround", type=float, default=0.0)
+    parser.add_argument("--vectorized-dates", action="store_true")
+    parser.add_argument("--compact-dtypes", action="store_true")
+    parser.add_argument(
+        "--pipelined",
+        type=int,
+        default=0,
+        metavar="CHUNK_ROWS",
+        help="overlap download, transform and insert in chunks of this size",
+    )
+    parser.add_argument("--output", help="write the report to this file")
+    args = parser.parse_args()
+
+    instruments = synthetic_universe(args.instruments)
+    fields = synthetic_fields(args.fields)
+    report = {
+        "version": version(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "parameters": {
+            "instruments": args.instruments,
+            "fields": len(fields),
+            "turnaround_sec": args.turnaround,
+            "vectorized_dates": args.vectorized_dates,
+            "compact_dtypes": args.compact_dtypes,
+            "pipelined_chunk_rows": args.pipelined,
+        },
+        **run(
+            instruments,
+            fields,
+            args.turnaround,
+            vectorized_dates=args.vectorized_dates,
+            compact_dtypes=args.compact_dtypes,
+            pipelined_chunk_rows=args.pipelined,
+        ),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
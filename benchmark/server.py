@@ -0,0 +1,284 @@
+"""Local stand-in for the Data License REST API endpoints used by ``Client``.
+
+The server runs on a background thread of the current process::
+
+    with DataLicenseStub() as stub:
+        client = stub_client(stub, instruments, fields)
+        ...
+        stub.deliver(f"{client.session_id}.json.gz", records)
+"""
+
+import datetime
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from oauthlib.oauth2 import BackendApplicationClient
+
+from app import Client
+from app.session import Session
+
+
+class DataLicenseStub:
+
+    CATALOG_ID = "40000"
+    TOKEN_PATH = "/ext/api/as/token.oauth2"
+
+    def __init__(self, heartbeat_sec=1.0, responder=None, turnaround_sec=0.0):
+        """``responder(payload, request_id)`` returns the records delivered
+        ``turnaround_sec`` after each submitted request; without it responses
+        are only published through ``deliver``."""
+        self.heartbeat_sec = heartbeat_sec
+        self.responder = responder
+        self.turnaround_sec = turnaround_sec
+        self.requests = {}
+        self.responses = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._routes = [
+            ("POST", self.TOKEN_PATH, self._token),
+            ("GET", r"/eap/catalogs/", self._catalogs),
+            ("POST", r"/eap/catalogs/(?P<catalog>[^/]+)/requests/", self._submit),
+            (
+                "GET",
+                r"/eap/catalogs/(?P<catalog>[^/]+)/content/responses/",
+                self._listing,
+            ),
+            (
+                "GET",
+                r"/eap/catalogs/(?P<catalog>[^/]+)/content/responses/(?P<key>.+)",
+                self._download,
+            ),
+            ("GET", r"/eap/notifications/sse", self._notifications),
+        ]
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.drop_streams()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def deliver(self, key, records=None, body=None, request_id=None):
+        """Publish a response file and notify the open SSE subscribers.
+        ``records`` are serialized to a gzip JSON array unless a raw gzip
+        ``body`` is given."""
+        if body is None:
+            body = gzip.compress(json.dumps(records or []).encode("utf-8"))
+        last_modified = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            self.responses[key] = {
+                "body": body,
+                "requestIdentifier": request_id,
+                "lastModified": last_modified.isoformat(timespec="seconds"),
+            }
+            subscribers = list(self._subscribers)
+        notification = {
+            "generated": {
+                "@type": "Distribution",
+                "key": key,
+                "snapshot": {"dataset": {"catalog": {"identifier": self.CATALOG_ID}}},
+            }
+        }
+        for subscriber in subscribers:
+            subscriber.put(notification)
+
+    def drop_streams(self):
+        """Close every open SSE stream, as a dropped connection would."""
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber.put(None)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._dispatch(self, "GET")
+
+            def do_POST(self):
+                stub._dispatch(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _dispatch(self, handler, method):
+        parts = urlsplit(handler.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        for route_method, pattern, view in self._routes:
+            match = re.fullmatch(pattern, parts.path)
+            if route_method == method and match:
+                return view(handler, query, **match.groupdict())
+        self._send_json(handler, {"error": f"No route for {parts.path}"}, 404)
+
+    def _token(self, handler, query):
+        length = int(handler.headers.get("Content-Length") or 0)
+        handler.rfile.read(length)
+        token = {"access_token": "stub", "token_type": "Bearer", "expires_in": 3600}
+        self._send_json(handler, token)
+
+    def _catalogs(self, handler, query):
+        catalogs = [
+            {"identifier": "bbg", "subscriptionType": "bbg"},
+            {"identifier": self.CATALOG_ID, "subscriptionType": "scheduled"},
+        ]
+        self._send_json(handler, {"contains": catalogs})
+
+    def _submit(self, handler, query, catalog):
+        length = int(handler.headers.get("Content-Length") or 0)
+        payload = json.loads(handler.rfile.read(length) or b"{}")
+        request_id = f"r{len(self.requests) + 1}{payload.get('name', '')}"
+        with self._lock:
+            self.requests[request_id] = payload
+        if self.responder is not None:
+            key = f"{payload.get('name', request_id)}.json.gz"
+            timer = threading.Timer(
+                self.turnaround_sec, self._respond, (key, payload, request_id)
+            )
+            timer.daemon = True
+            timer.start()
+        location = f"/eap/catalogs/{catalog}/requests/{request_id}/"
+        self._send_json(
+            handler,
+            {"request": {"identifier": request_id}},
+            201,
+            headers={"Location": location},
+        )
+
+    def _respond(self, key, payload, request_id):
+        records = list(self.responder(payload, request_id))
+        self.deliver(key, records, request_id=request_id)
+
+    def _listing(self, handler, query, catalog):
+        prefix = query.get("prefix", "")
+        with self._lock:
+            contains = [
+                {
+                    "key": key,
+                    "lastModified": response["lastModified"],
+                    "contentLength": len(response["body"]),
+                }
+                for key, response in self.responses.items()
+                if key.startswith(prefix)
+            ]
+        self._send_json(handler, {"contains": contains})
+
+    def _download(self, handler, query, catalog, key):
+        response = self.responses.get(key)
+        if response is None:
+            return self._send_json(handler, {"error": f"{key} not found"}, 404)
+        body = response["body"]
+        start = re.fullmatch(r"bytes=(\d+)-", handler.headers.get("Range", ""))
+        if start:
+            start = int(start.group(1))
+            handler.send_response(206)
+            handler.send_header(
+                "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+            )
+            body = body[start:]
+        else:
+            handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Encoding", "gzip")
+        handler.send_header("Content-Length", str(len(body)))
+        last_modified = datetime.datetime.fromisoformat(response["lastModified"])
+        handler.send_header("Last-Modified", format_datetime(last_modified, True))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _notifications(self, handler, query):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.append(subscriber)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        try:
+            while True:
+                try:
+                    notification = subscriber.get(timeout=self.heartbeat_sec)
+                except queue.Empty:
+                    message = "event: heartbeat\ndata: heartbeat\n\n"
+                else:
+                    if notification is None:
+                        break
+                    message = f"data: {json.dumps(notification)}\n\n"
+                handler.wfile.write(message.encode("utf-8"))
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+
+    @staticmethod
+    def _send_json(handler, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def stub_session(stub):
+    """Session authenticated against the stub token endpoint over plain HTTP."""
+    os.environ.setdefault("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    session_class = type(
+        "StubSession", (Session,), {"OAUTH2_ENDPOINT": stub.url + stub.TOKEN_PATH}
+    )
+    client = BackendApplicationClient(client_id="stub")
+    session = session_class(client_secret="stub", client=client)
+    session.headers["api-version"] = "2"
+    session.request_token()
+    return session
+
+
+def stub_client(stub, instruments, fields, session=None, **kwargs):
+    """Build a ``Client`` talking to ``stub`` instead of api.bloomberg.com."""
+    client_class = type("StubClient", (Client,), {"HOST": stub.url})
+    options = dict(
+        ti_usernumber=0,
+        ti_serialnumber=0,
+        ti_workstation=0,
+        reply_timeout_min=1,
+        identifier_type="ISIN",
+    )
+    options.update(kwargs)
+    return client_class(
+        instruments=instruments,
+        fields=fields,
+        session=session or stub_session(stub),
+        **options,
+    )
@@ -0,0 +1,52 @@
+"""In-memory SQLite stand-in for ``MSSQLDatabase`` in benchmarks."""
+
+import sqlite3
+
+from config import logger
+
+
+class SQLiteSink:
+
+    def __init__(self, path=":memory:"):
+        self.cnx = sqlite3.connect(path, check_same_thread=False)
+
+    def insert_table(
+        self,
+        df,
+        table_name,
+        if_exists="append",
+        delete_prev_records=True,
+        sql_types=None,
+    ):
+        return self.insert_chunks(
+            [df], table_name, if_exists, delete_prev_records, sql_types
+        )
+
+    def insert_chunks(
+        self,
+        chunks,
+        table_name,
+        if_exists="append",
+        delete_prev_records=True,
+        sql_types=None,
+    ):
+        cursor = self.cnx.cursor()
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table_name,),
+        ).fetchone()
+        if delete_prev_records and exists:
+            cursor.execute(f"DELETE FROM {table_name}")
+        rows = 0
+        for df in chunks:
+            df.to_sql(table_name, self.cnx, if_exists=if_exists, index=False)
+            rows += len(df)
+        self.cnx.commit()
+        logger.info(f"Inserted {rows} rows into {table_name} table")
+        return rows
+
+    def count(self, table_name):
+        return self.cnx.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+    def close(self):
+        self.cnx.close()
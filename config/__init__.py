@@ -1 +1,2 @@
 from config.logger import logger
+from config.metrics import recorder
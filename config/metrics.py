@@ -0,0 +1,233 @@
+import cProfile
+import datetime
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from config import settings
+from config.logger import logger
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS(threading.Thread):
+    """Sample the resident set size until stopped and keep the maximum."""
+
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+class Recorder:
+    """Collect wall time, peak RSS, row and byte counts per pipeline stage
+    and per HTTP call, and emit them as a run summary."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.datetime.utcnow()
+            self.stages = {}
+            self.http = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the block; it may set ``rows`` and ``bytes`` on the
+        yielded dict."""
+        metrics = {}
+        sampler = PeakRSS()
+        sampler.start()
+        profiler = self._start_profiler()
+        tracing = self._start_tracemalloc()
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics["wall_sec"] = time.perf_counter() - start
+            metrics["peak_rss"] = sampler.stop()
+            if tracing:
+                metrics["python_alloc_peak"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if profiler:
+                profiler.disable()
+                self._dump_profile(profiler, name)
+            self._add_stage(name, metrics)
+            logger.debug(f"Stage {name}: {self._format(metrics)}")
+
+    def record_http(self, method, url, status, elapsed, size):
+        endpoint = (method, urlsplit(url).path)
+        with self._lock:
+            call = self.http.setdefault(
+                endpoint, {"count": 0, "errors": 0, "wall_sec": 0.0, "bytes": 0}
+            )
+            call["count"] += 1
+            call["errors"] += status is None or status >= 400
+            call["wall_sec"] += elapsed
+            call["bytes"] += size
+
+    def summary(self):
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            http = [
+                {"method": method, "endpoint": endpoint, **call}
+                for (method, endpoint), call in sorted(self.http.items())
+            ]
+        for stage in stages.values():
+            if stage["wall_sec"] > 0:
+                if "rows" in stage:
+                    stage["rows_per_sec"] = stage["rows"] / stage["wall_sec"]
+                if "bytes" in stage:
+                    stage["mb_per_sec"] = stage["bytes"] / stage["wall_sec"] / 2**20
+        return {
+            "started_at": self.started_at.isoformat(),
+            "wall_sec": (datetime.datetime.utcnow() - self.started_at).total_seconds(),
+            "peak_rss": max(
+                [current_rss()] + [stage["peak_rss"] for stage in stages.values()]
+            ),
+            "stages": stages,
+            "http": http,
+        }
+
+    def emit(self):
+        """Log the run summary and write it to METRICS_PATH, as JSON or as
+        a Prometheus textfile depending on METRICS_FORMAT."""
+        summary = self.summary()
+        logger.info(f"Run summary: {json.dumps(summary)}")
+        if not settings.METRICS_PATH:
+            return summary
+
+        if settings.METRICS_FORMAT == "prometheus":
+            content = self._prometheus(summary)
+        else:
+            content = json.dumps(summary, indent=2)
+        tmp_path = f"{settings.METRICS_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, settings.METRICS_PATH)
+        logger.info(f"Run metrics written to {settings.METRICS_PATH}")
+        return summary
+
+    def _add_stage(self, name, metrics):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"count": 0, "wall_sec": 0.0})
+            stage["count"] += 1
+            for key, value in metrics.items():
+                if key in ("peak_rss", "python_alloc_peak"):
+                    stage[key] = max(stage.get(key, 0), value)
+                else:
+                    stage[key] = stage.get(key, 0) + value
+
+    @staticmethod
+    def _start_profiler():
+        if not settings.METRICS_PROFILE:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active, e.g. in an enclosing stage
+            return None
+        return profiler
+
+    @staticmethod
+    def _dump_profile(profiler, name):
+        os.makedirs(settings.METRICS_PROFILE_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_PROFILE_DIR, f"{name}.prof")
+        profiler.dump_stats(path)
+        logger.info(f"Profile of stage {name} written to {path}")
+
+    @staticmethod
+    def _start_tracemalloc():
+        if not settings.METRICS_TRACEMALLOC or tracemalloc.is_tracing():
+            return False
+        tracemalloc.start()
+        return True
+
+    @staticmethod
+    def _format(metrics):
+        return ", ".join(
+            f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in metrics.items()
+        )
+
+    @staticmethod
+    def _prometheus(summary):
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP bdlc_{name} {help_text}")
+            lines.append(f"# TYPE bdlc_{name} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                label_text = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"bdlc_{name}{label_text} {value}")
+
+        stages = summary["stages"].items()
+        metric(
+            "stage_wall_seconds",
+            "Wall time spent in each pipeline stage.",
+            [({"stage": name}, stage["wall_sec"]) for name, stage in stages],
+        )
+        metric(
+            "stage_peak_rss_bytes",
+            "Peak resident set size while each stage ran.",
+            [({"stage": name}, stage["peak_rss"]) for name, stage in stages],
+        )
+        for key, help_text in (
+            ("rows", "Rows processed by each stage."),
+            ("bytes", "Bytes transferred by each stage."),
+        ):
+            metric(
+                f"stage_{key}",
+                help_text,
+                [({"stage": name}, s[key]) for name, s in stages if key in s],
+            )
+        http = summary["http"]
+        for key, help_text in (
+            ("count", "HTTP calls made through Session.send."),
+            ("errors", "HTTP calls that failed or returned an error status."),
+            ("wall_sec", "Wall time spent in HTTP calls."),
+            ("bytes", "Bytes received from HTTP calls."),
+        ):
+            metric(
+                f"http_{key}",
+                help_text,
+                [
+                    ({"method": c["method"], "endpoint": c["endpoint"]}, c[key])
+                    for c in http
+                ],
+            )
+        metric(
+            "run_wall_seconds",
+            "Wall time of the whole run.",
+            [({}, summary["wall_sec"])],
+        )
+        return "\n".join(lines) + "\n"
+
+
+recorder = Recorder()
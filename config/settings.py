@@ -1,6 +1,6 @@
 import json
 
-from decouple import config
+from decouple import UndefinedValueError, config
 
 credentials_cast = lambda x: json.loads(x)  # noqa: E731
 list_cast = lambda x: [  # noqa: E731
@@ -8,23 +8,112 @@ list_cast = lambda x: [  # noqa: E731
 ]
 
 LOG_LEVEL = config("LOG_LEVEL", default="INFO")
-CREDENTIALS = config("CREDENTIALS", cast=credentials_cast)
-TI_USERNUMBER = config("TI_USERNUMBER", cast=int)
-TI_SERIALNUMBER = config("TI_SERIALNUMBER", cast=int)
-TI_WORKSTATION = config("TI_WORKSTATION", cast=int)
-IDENTIFIER_TYPE = config("IDENTIFIER_TYPE")
-DB_IDS_QUERY = config("DB_IDS_QUERY")
-FIELDS = config("FIELDS", cast=list_cast)
+METRICS_PATH = config("METRICS_PATH", default="")
+METRICS_FORMAT = config("METRICS_FORMAT", default="json")
+METRICS_PROFILE = config("METRICS_PROFILE", cast=bool, default=False)
+METRICS_PROFILE_DIR = config("METRICS_PROFILE_DIR", default="profiles")
+METRICS_TRACEMALLOC = config("METRICS_TRACEMALLOC", cast=bool, default=False)
+DB_IDS_QUERY = config("DB_IDS_QUERY", default="")
+DB_IDS_FETCH_ROWS = config("DB_IDS_FETCH_ROWS", default=10000, cast=int)
+FIELDS = config("FIELDS", default="", cast=list_cast)
 BBG_REPLY_TIMEOUT_MIN = config("BBG_REPLY_TIMEOUT_MIN", default=30, cast=int)
-IGNORE_COLUMNS = config("IGNORE_COLUMNS", default=[], cast=list_cast)
-OUTPUT_TABLE = config("OUTPUT_TABLE")
+LISTEN_MODE = config("LISTEN_MODE", default="poll")
+POLL_INTERVAL_MIN_SEC = config("POLL_INTERVAL_MIN_SEC", default=10, cast=int)
+POLL_INTERVAL_MAX_SEC = config("POLL_INTERVAL_MAX_SEC", default=60, cast=int)
+REQUEST_SHARD_SIZE = config("REQUEST_SHARD_SIZE", default=0, cast=int)
+REQUEST_CONCURRENCY = config("REQUEST_CONCURRENCY", default=4, cast=int)
+SHARD_MAX_RETRIES = config("SHARD_MAX_RETRIES", default=2, cast=int)
+DOWNLOAD_STREAM = config("DOWNLOAD_STREAM", cast=bool, default=False)
+DOWNLOAD_CHUNK_ROWS = config("DOWNLOAD_CHUNK_ROWS", default=50000, cast=int)
+DOWNLOAD_CONCURRENCY = config("DOWNLOAD_CONCURRENCY", default=4, cast=int)
+DOWNLOAD_MAX_RESUMES = config("DOWNLOAD_MAX_RESUMES", default=3, cast=int)
+DOWNLOAD_SPOOL_DIR = config("DOWNLOAD_SPOOL_DIR", default="")
+PIPELINED = config("PIPELINED", cast=bool, default=False)
+PIPELINE_QUEUE_SIZE = config("PIPELINE_QUEUE_SIZE", default=4, cast=int)
+RESPONSE_CACHE_DIR = config("RESPONSE_CACHE_DIR", default="")
+RESPONSE_CACHE_MAX_MB = config("RESPONSE_CACHE_MAX_MB", default=2048, cast=int)
+RESPONSE_CACHE_MAX_AGE_HOURS = config(
+    "RESPONSE_CACHE_MAX_AGE_HOURS", default=72, cast=int
+)
+METADATA_CACHE_PATH = config("METADATA_CACHE_PATH", default="")
+METADATA_CATALOG_TTL_HOURS = config("METADATA_CATALOG_TTL_HOURS", default=24, cast=int)
+CHECKPOINT_PATH = config("CHECKPOINT_PATH", default="")
+CHECKPOINT_MAX_AGE_HOURS = config("CHECKPOINT_MAX_AGE_HOURS", default=24, cast=int)
+IGNORE_COLUMNS = config("IGNORE_COLUMNS", default="", cast=list_cast)
+VECTORIZED_DATES = config("VECTORIZED_DATES", cast=bool, default=False)
+COMPACT_DTYPES = config("COMPACT_DTYPES", cast=bool, default=False)
+CATEGORY_MAX_RATIO = config("CATEGORY_MAX_RATIO", default=0.5, cast=float)
+SCHEMA_OVERRIDES_PATH = config("SCHEMA_OVERRIDES_PATH", default="")
+OUTPUT_TABLE = config("OUTPUT_TABLE", default="")
+WRITE_MODE = config("WRITE_MODE", default="replace")
+BACKFILL_WINDOW_DAYS = config("BACKFILL_WINDOW_DAYS", default=30, cast=int)
+BACKFILL_CONCURRENCY = config("BACKFILL_CONCURRENCY", default=4, cast=int)
+BACKFILL_PERIOD = config("BACKFILL_PERIOD", default="daily")
+BACKFILL_DATE_COLUMN = config("BACKFILL_DATE_COLUMN", default="DATE")
+BACKFILL_STATE_PATH = config("BACKFILL_STATE_PATH", default="backfill_state.json")
+PARQUET_PATH = config("PARQUET_PATH", default="")
+PARQUET_FIELD_GROUP = config("PARQUET_FIELD_GROUP", default="")
+INCREMENTAL_UNIVERSE = config("INCREMENTAL_UNIVERSE", cast=bool, default=False)
+UNIVERSE_MAX_AGE_HOURS = config("UNIVERSE_MAX_AGE_HOURS", default=24, cast=float)
+UNIVERSE_KEY_COLUMN = config("UNIVERSE_KEY_COLUMN", default="IDENTIFIER")
+UNIVERSE_RC_COLUMN = config("UNIVERSE_RC_COLUMN", default="RC")
+UPSERT_KEY = config("UPSERT_KEY", default="", cast=list_cast)
+UPSERT_IGNORE_CHANGES = config(
+    "UPSERT_IGNORE_CHANGES", default="timestamp_created_utc", cast=list_cast
+)
 INSERTER_MAX_RETRIES = config("INSERTER_MAX_RETRIES", default=3, cast=int)
+INSERT_CHUNK_ROWS = config("INSERT_CHUNK_ROWS", default=50000, cast=int)
+INSERT_CONCURRENCY = config("INSERT_CONCURRENCY", default=1, cast=int)
 REQUEST_MAX_RETRIES = config("REQUEST_MAX_RETRIES", default=3, cast=int)
 REQUEST_BACKOFF_FACTOR = config("REQUEST_BACKOFF_FACTOR", default=2, cast=int)
+REQUEST_TIMEOUT_SEC = config("REQUEST_TIMEOUT_SEC", default=60, cast=int)
+HTTP_POOL_SIZE = config("HTTP_POOL_SIZE", default=16, cast=int)
 MSSQL_AD_LOGIN = config("MSSQL_AD_LOGIN", cast=bool, default=False)
-MSSQL_SERVER = config("MSSQL_SERVER")
-MSSQL_DATABASE = config("MSSQL_DATABASE")
+MSSQL_POOL_SIZE = config("MSSQL_POOL_SIZE", default=4, cast=int)
 
+# Settings without a default are only read when first used, so that a step
+# of the bdlc CLI does not need the settings of the other steps. Check the
+# ones a step needs up front with ``require``.
+_REQUIRED = {
+    "CREDENTIALS": credentials_cast,
+    "TI_USERNUMBER": int,
+    "TI_SERIALNUMBER": int,
+    "TI_WORKSTATION": int,
+    "IDENTIFIER_TYPE": str,
+    "MSSQL_SERVER": str,
+    "MSSQL_DATABASE": str,
+    "MSSQL_USERNAME": str,
+    "MSSQL_PASSWORD": str,
+}
+BLOOMBERG = (
+    "CREDENTIALS",
+    "TI_USERNUMBER",
+    "TI_SERIALNUMBER",
+    "TI_WORKSTATION",
+    "IDENTIFIER_TYPE",
+)
+MSSQL = ("MSSQL_SERVER", "MSSQL_DATABASE")
 if not MSSQL_AD_LOGIN:
-    MSSQL_USERNAME = config("MSSQL_USERNAME")
-    MSSQL_PASSWORD = config("MSSQL_PASSWORD")
+    MSSQL += ("MSSQL_USERNAME", "MSSQL_PASSWORD")
+
+
+def __getattr__(name):
+    if name not in _REQUIRED:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = config(name, cast=_REQUIRED[name])
+    globals()[name] = value
+    return value
+
+
+def require(*names):
+    """Raise one error naming every setting of ``names`` that is not set."""
+    missing = []
+    for name in names:
+        try:
+            value = globals()[name] if name in globals() else __getattr__(name)
+        except UndefinedValueError:
+            value = None
+        if value is None or value in ("", []):
+            missing.append(name)
+    if missing:
+        raise RuntimeError(f"Missing settings: {missing}")
@@ -0,0 +1,171 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pyodbc
+
+from config import logger
+
+
+class BulkLoader:
+    """Load a DataFrame into SQL Server in chunks of ``chunk_rows`` rows.
+
+    The chunks are written over up to ``concurrency`` pooled connections,
+    each into its own heap staging table copied from the target table, so
+    that ``TABLOCK`` never makes the writers wait for each other. Every chunk
+    is committed on its own and retried up to ``max_retries`` times. The
+    caller then moves the staged rows into place in a single statement.
+    """
+
+    RETRY_BACKOFF_SEC = 1
+
+    def __init__(self, manager, chunk_rows, concurrency=1, max_retries=3):
+        self.manager = manager
+        self.chunk_rows = max(1, chunk_rows)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+
+    def split(self, df):
+        """Slice ``df`` into chunks of ``chunk_rows`` rows; an empty frame
+        still yields one (empty) chunk."""
+        for start in range(0, max(len(df), 1), self.chunk_rows):
+            end = start + self.chunk_rows
+            yield df.iloc[start:end]
+
+    @contextmanager
+    def staged(self, chunks, table_name, columns):
+        """Stage the DataFrames of ``chunks`` next to ``table_name`` and
+        yield a SELECT over the staged rows, e.g. for ``INSERT INTO ...
+        SELECT`` or ``MERGE ... USING``, with the number of rows staged.
+
+        ``chunks`` may be a generator still being produced, e.g. by a
+        download; the writers pull from it in turn. The staging tables are
+        dropped on exit. Their names are unique to the call, so that loads
+        into the same table, e.g. the windows of a backfill, can run at the
+        same time."""
+        token = uuid.uuid4().hex[:8]
+        heaps = [f"{table_name}__staging_{token}_{n}" for n in range(self.concurrency)]
+        chunks = iter(chunks)
+        pull_lock = threading.Lock()
+        failed = threading.Event()
+
+        def pull():
+            with pull_lock:
+                if failed.is_set():
+                    return None
+                return next(chunks, None)
+
+        def load(heap):
+            try:
+                return self._load_worker(pull, heap, columns)
+            except BaseException:
+                failed.set()
+                raise
+
+        try:
+            self._create_heaps(table_name, heaps, columns)
+            with ThreadPoolExecutor(max_workers=len(heaps)) as executor:
+                loaded = sum(executor.map(load, heaps))
+            logger.info(f"Staged {loaded} rows in {len(heaps)} staging tables")
+            source = " UNION ALL ".join(
+                f"SELECT {', '.join(columns)} FROM {heap}" for heap in heaps
+            )
+            yield source, loaded
+        finally:
+            self._drop_heaps(heaps)
+
+    def _create_heaps(self, table_name, heaps, columns):
+        with self.manager.connection() as cnx:
+            cursor = cnx.cursor()
+            for heap in heaps:
+                cursor.execute(f"DROP TABLE IF EXISTS {heap}")
+                # SELECT INTO copies the column types but no index: a heap
+                cursor.execute(
+                    f"SELECT TOP 0 {', '.join(columns)} INTO {heap} FROM {table_name}"
+                )
+            cnx.commit()
+
+    def _drop_heaps(self, heaps):
+        try:
+            with self.manager.connection() as cnx:
+                cursor = cnx.cursor()
+                for heap in heaps:
+                    cursor.execute(f"DROP TABLE IF EXISTS {heap}")
+                cnx.commit()
+        except pyodbc.Error as e:
+            logger.warning(f"Could not drop staging tables {heaps}: {e}")
+
+    def _load_worker(self, pull, heap, columns):
+        """Write the chunks returned by ``pull`` into ``heap`` over one
+        connection until it returns None."""
+        statement = (
+            f"INSERT INTO {heap} WITH (TABLOCK) ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        loaded = 0
+        cnx = self.manager.acquire()
+        try:
+            input_sizes = self._input_sizes(cnx.cursor(), heap, columns)
+            while (df := pull()) is not None:
+                for chunk in self.split(df):
+                    if chunk.empty:
+                        continue
+                    rows = self._rows(chunk)
+                    for attempt in range(self.max_retries + 1):
+                        try:
+                            self._insert_chunk(cnx, statement, input_sizes, rows)
+                            break
+                        except pyodbc.Error as e:
+                            if attempt == self.max_retries:
+                                logger.error(f"Chunk of {heap} failed, giving up: {e}")
+                                raise
+                            logger.warning(
+                                f"Chunk of {heap} failed (attempt {attempt + 1}), "
+                                f"retrying: {e}"
+                            )
+                            self.manager.release(cnx)
+                            cnx = None
+                            time.sleep(self.RETRY_BACKOFF_SEC * 2**attempt)
+                            cnx = self.manager.acquire()
+                    loaded += len(rows)
+                    logger.debug(f"Loaded chunk of {len(rows)} rows into {heap}")
+        finally:
+            if cnx is not None:
+                self.manager.release(cnx)
+        return loaded
+
+    @staticmethod
+    def _insert_chunk(cnx, statement, input_sizes, rows):
+        cursor = cnx.cursor()
+        cursor.fast_executemany = True
+        if input_sizes:
+            cursor.setinputsizes(input_sizes)
+        cursor.executemany(statement, rows)
+        cnx.commit()
+
+    @staticmethod
+    def _input_sizes(cursor, heap, columns):
+        """Size the parameter arrays from the staging table definition so
+        that fast_executemany neither probes the server nor guesses buffer
+        sizes from the first row."""
+        schema, _, table = heap.rpartition(".")
+        described = {
+            row.column_name.lower(): (
+                row.data_type,
+                row.column_size,
+                row.decimal_digits,
+            )
+            for row in cursor.columns(table=table, schema=schema or None)
+        }
+        sizes = [described.get(column.strip("[]").lower()) for column in columns]
+        if None in sizes:
+            logger.warning(f"Could not describe {heap}, letting the driver size it")
+            return None
+        return sizes
+
+    @staticmethod
+    def _rows(chunk):
+        values = chunk.astype(object).where(chunk.notna(), None)
+        return values.values.tolist()
@@ -0,0 +1,122 @@
+import queue
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+import pyodbc
+
+from config import logger
+
+SQL_COPT_SS_ACCESS_TOKEN = 1256
+TOKEN_SCOPE = "https://database.windows.net/.default"
+
+
+def pyodbc_attrs(access_token: str) -> dict:
+    # The driver expects the token as UTF-16-LE prefixed by its byte length
+    exp_token = access_token.encode("utf-16-le")
+    return {SQL_COPT_SS_ACCESS_TOKEN: struct.pack("=i", len(exp_token)) + exp_token}
+
+
+class ConnectionManager:
+    """Process-wide cache of the Azure AD access token and a small pool of
+    pyodbc connections, validated before they are handed out again."""
+
+    TOKEN_REFRESH_MARGIN_SEC = 300
+
+    def __init__(self, cnx_str, ad_login, pool_size):
+        self.cnx_str = cnx_str
+        self.ad_login = ad_login
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._credential = None
+        self._token = None
+
+    def access_token(self):
+        with self._lock:
+            expires_in = self._token.expires_on - time.time() if self._token else 0
+            if expires_in < self.TOKEN_REFRESH_MARGIN_SEC:
+                if self._credential is None:
+                    # Only needed with MSSQL_AD_LOGIN, and slow to import
+                    from azure.identity import DefaultAzureCredential
+
+                    self._credential = DefaultAzureCredential(
+                        exclude_shared_token_cache_credential=True
+                    )
+                self._token = self._credential.get_token(TOKEN_SCOPE)
+                logger.debug("Fetched a new database access token")
+            return self._token.token
+
+    def acquire(self):
+        while True:
+            try:
+                cnx = self._pool.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if self._is_healthy(cnx):
+                return cnx
+            self._discard(cnx)
+
+    def release(self, cnx):
+        try:
+            cnx.rollback()
+        except pyodbc.Error as e:
+            logger.warning(f"Discarding broken connection: {e}")
+            self._discard(cnx)
+            return
+
+        if self._pool.qsize() < self.pool_size:
+            self._pool.put(cnx)
+        else:
+            self._discard(cnx)
+
+    @contextmanager
+    def connection(self):
+        cnx = self.acquire()
+        try:
+            yield cnx
+        finally:
+            self.release(cnx)
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self._pool.get_nowait())
+            except queue.Empty:
+                return
+
+    def _connect(self):
+        kwargs = {}
+        if self.ad_login:
+            kwargs["attrs_before"] = pyodbc_attrs(self.access_token())
+        logger.debug("Opening a new database connection")
+        return pyodbc.connect(self.cnx_str, **kwargs)
+
+    @staticmethod
+    def _is_healthy(cnx):
+        try:
+            cnx.cursor().execute("SELECT 1").fetchone()
+            return True
+        except pyodbc.Error as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            return False
+
+    @staticmethod
+    def _discard(cnx):
+        try:
+            cnx.close()
+        except pyodbc.Error as e:
+            logger.warning(f"Error closing stale connection: {e}")
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(cnx_str, ad_login, pool_size):
+    """Return the manager shared by every MSSQLDatabase using ``cnx_str``."""
+    with _managers_lock:
+        if cnx_str not in _managers:
+            _managers[cnx_str] = ConnectionManager(cnx_str, ad_login, pool_size)
+        return _managers[cnx_str]
@@ -1,114 +1,718 @@
-import struct
+import itertools
+import re
+import threading
 import warnings
+from collections import Counter
 
 import numpy as np
 import pandas as pd
 import pyodbc
-from azure.identity import DefaultAzureCredential
-from fast_to_sql import fast_to_sql
+from fast_to_sql.utils.utility_funs import clean_col_name
 
 from config import logger, settings
+from database.bulk import BulkLoader
+from database.connection import get_manager
 
 warnings.filterwarnings("ignore")
 
-
-def pyodbc_attrs(access_token: str) -> dict:
-    SQL_COPT_SS_ACCESS_TOKEN = 1256
-    token_bytes = bytes(access_token, "utf-8")
-    exp_token = b""
-    for i in token_bytes:
-        exp_token += bytes({i}) + bytes(1)
-    return {SQL_COPT_SS_ACCESS_TOKEN: struct.pack("=i", len(exp_token)) + exp_token}
+# Suffixes of the tables and constraints taking part in a swap
+SHADOW_SUFFIX = "__shadow"
+PREVIOUS_SUFFIX = "__prev"
 
 
 class MSSQLDatabase(object):
-    AD_LOGIN = settings.MSSQL_AD_LOGIN
-    SERVER = settings.MSSQL_SERVER
-    DATABASE = settings.MSSQL_DATABASE
-    if not AD_LOGIN:
-        USERNAME = settings.MSSQL_USERNAME
-        PASSWORD = settings.MSSQL_PASSWORD
+    # Concurrent loads into a new table, e.g. backfill windows, must not
+    # both create it
+    _create_lock = threading.Lock()
 
     def __init__(self):
-        self.cnx_kwargs = {}
+        self.cnx = None
+        self.AD_LOGIN = settings.MSSQL_AD_LOGIN
+        self.SERVER = settings.MSSQL_SERVER
+        self.DATABASE = settings.MSSQL_DATABASE
         if not self.AD_LOGIN:
             self.cnx_str = (
                 "DRIVER={ODBC Driver 18 for SQL Server};"
                 f"SERVER={self.SERVER};DATABASE={self.DATABASE};"
-                f"UID={self.USERNAME};PWD={self.PASSWORD}"
+                f"UID={settings.MSSQL_USERNAME};PWD={settings.MSSQL_PASSWORD}"
             )
         else:
-            token = self.fecth_token()
-            self.cnx_kwargs["attrs_before"] = pyodbc_attrs(token)
             self.cnx_str = (
                 "DRIVER={ODBC Driver 18 for SQL Server};"
                 f"SERVER={self.SERVER};DATABASE={self.DATABASE};Encrypt=yes"
             )
+        self.manager = get_manager(
+            self.cnx_str, self.AD_LOGIN, settings.MSSQL_POOL_SIZE
+        )
+        self.loader = BulkLoader(
+            self.manager,
+            chunk_rows=settings.INSERT_CHUNK_ROWS,
+            concurrency=settings.INSERT_CONCURRENCY,
+            max_retries=settings.INSERTER_MAX_RETRIES,
+        )
 
     def _get_connection(self):
-        return pyodbc.connect(self.cnx_str, **self.cnx_kwargs)
+        return self.manager.acquire()
 
     def reopen_connection(self):
-        try:
-            if hasattr(self, "cnx") and self.cnx:
-                self.cnx.close()
-        except Exception as e:
-            logger.warning(f"Error closing stale connection: {e}")
-
+        self.release_connection()
         self.cnx = self._get_connection()
 
-    def select_table(self, query):
+    def release_connection(self):
+        if self.cnx is not None:
+            self.manager.release(self.cnx)
+            self.cnx = None
+
+    def iter_column(self, query, batch_rows):
+        """Yield the first column of the rows of ``query``, fetched
+        ``batch_rows`` at a time instead of loaded into a DataFrame."""
         self.reopen_connection()
         logger.info(query)
         try:
-            df = pd.read_sql(query, self.cnx)
-            logger.debug(f"Selected {len(df)} rows")
-            return df
+            cursor = self.cnx.cursor()
+            cursor.execute(query)
+            rows = cursor.fetchmany(batch_rows)
+            while rows:
+                for row in rows:
+                    yield row[0]
+                rows = cursor.fetchmany(batch_rows)
+            cursor.close()
         except Exception as e:
             logger.error(f"Error executing SELECT query: {e}")
             raise
         finally:
-            self.cnx.close()
+            self.release_connection()
 
     def insert_table(
-        self, df, table_name, if_exists="append", delete_prev_records=True
+        self,
+        df,
+        table_name,
+        if_exists="append",
+        delete_prev_records=True,
+        sql_types=None,
+    ):
+        """Bulk-load ``df`` into staging tables, then replace (or append to)
+        the content of ``table_name`` with it in one transaction.
+
+        ``sql_types`` maps columns to the SQL types used when the table is
+        created; other columns get datetime, bigint, float or varchar(100).
+        ``if_exists`` is "append", "replace" (drop and recreate) or "fail".
+        """
+        return self.insert_chunks(
+            self.loader.split(df),
+            table_name,
+            if_exists=if_exists,
+            delete_prev_records=delete_prev_records,
+            sql_types=sql_types,
+        )
+
+    def insert_chunks(
+        self,
+        chunks,
+        table_name,
+        if_exists="append",
+        delete_prev_records=True,
+        sql_types=None,
+        delete_where=None,
     ):
+        """Same as ``insert_table`` for an iterable of DataFrames, which is
+        staged while it is still being produced. The table is only touched
+        once every chunk is staged, and not at all if there is none.
+
+        ``delete_where`` is a condition deleting only the matching rows in
+        the same transaction, instead of all of them with
+        ``delete_prev_records``.
+
+        :return: number of rows inserted
+        """
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is None:
+            logger.warning(f"No data to insert into {table_name}")
+            return 0
+
+        columns = [clean_col_name(column) for column in first.columns]
+        self._create_table(first, table_name, columns, sql_types, if_exists)
+        chunks = itertools.chain([first], chunks)
+        with self.loader.staged(chunks, table_name, columns) as (source, rows):
+            self.reopen_connection()
+            cursor = self.cnx.cursor()
+            try:
+                if delete_where:
+                    cursor.execute(f"DELETE FROM {table_name} WHERE {delete_where}")
+                elif delete_prev_records:
+                    cursor.execute(f"DELETE FROM {table_name}")
+                cursor.execute(
+                    f"INSERT INTO {table_name} WITH (TABLOCK) "
+                    f"({', '.join(columns)}) {source}"
+                )
+                self.cnx.commit()
+                logger.info(f"Inserted {rows} rows into {table_name} table")
+            except Exception as e:
+                self.cnx.rollback()
+                logger.error(f"Error inserting into table {table_name}: {e}")
+                raise
+            finally:
+                self.release_connection()
+        return rows
+
+    def swap_table(self, df, table_name, sql_types=None):
+        """Replace the content of ``table_name`` with ``df`` through a
+        shadow table, see ``swap_chunks``."""
+        return self.swap_chunks(self.loader.split(df), table_name, sql_types)
+
+    def swap_chunks(self, chunks, table_name, sql_types=None):
+        """Load an iterable of DataFrames into a shadow copy of
+        ``table_name``, with its columns, indexes, constraints and
+        permissions, and swap it in with ``sp_rename`` in one short
+        transaction, which also moves the triggers and the foreign keys of
+        other tables referencing ``table_name`` to the new table.
+
+        Readers keep seeing the previous content during the load, and a
+        failed load leaves ``table_name`` untouched. The replaced table is
+        kept as ``<table_name>__prev`` until the next swap, see
+        ``restore_previous``.
+
+        :return: number of rows loaded
+        """
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is None:
+            logger.warning(f"No data to swap into {table_name}")
+            return 0
+
+        columns = [clean_col_name(column) for column in first.columns]
+        self._create_table(first, table_name, columns, sql_types, if_exists="append")
+        shadow = f"{table_name}{SHADOW_SUFFIX}"
+        indexes = self._create_shadow(table_name, shadow)
+        try:
+            chunks = itertools.chain([first], chunks)
+            with self.loader.staged(chunks, shadow, columns) as (source, rows):
+                self._execute(
+                    f"INSERT INTO {shadow} WITH (TABLOCK) "
+                    f"({', '.join(columns)}) {source}"
+                )
+            # Indexing once loaded is cheaper than maintaining them per row
+            self._execute(*indexes)
+            self._execute(*self._swap_statements(table_name, shadow))
+        except BaseException:
+            self._drop_table(shadow)
+            raise
+        logger.info(f"Swapped {rows} rows into {table_name} table")
+        return rows
+
+    def restore_previous(self, table_name):
+        """Swap back the table replaced by the last ``swap_chunks``; the
+        current one becomes ``<table_name>__prev``."""
+        previous = f"{table_name}{PREVIOUS_SUFFIX}"
         self.reopen_connection()
-        if delete_prev_records:
+        try:
+            exists = self._table_exists(self.cnx.cursor(), previous)
+        finally:
+            self.release_connection()
+        if not exists:
+            raise RuntimeError(f"No previous version of {table_name} to restore")
+
+        self._execute(*self._swap_statements(table_name, previous))
+        logger.info(f"Restored the previous version of {table_name}")
+
+    def upsert_table(
+        self,
+        df,
+        table_name,
+        key_columns,
+        ignore_changes=(),
+        sql_types=None,
+        delete_missing=True,
+    ):
+        """Bulk-load ``df`` into staging tables and MERGE it into
+        ``table_name`` on ``key_columns``: new keys are inserted, keys whose
+        values changed are updated and, with ``delete_missing``, keys missing
+        from ``df`` are deleted. Columns in ``ignore_changes`` are written but
+        do not by themselves make a row count as changed.
+
+        :return: number of rows inserted, updated and deleted
+        """
+        if not key_columns:
+            raise ValueError("Upsert requires at least one key column")
+
+        duplicated = df.duplicated(subset=key_columns, keep="last")
+        if duplicated.any():
+            logger.warning(
+                f"Dropping {duplicated.sum()} rows with duplicated keys {key_columns}"
+            )
+            df = df[~duplicated]
+
+        self.reopen_connection()
+        exists = self._table_exists(self.cnx.cursor(), table_name)
+        self.release_connection()
+        if not exists:
+            logger.info(f"Table {table_name} does not exist, creating it")
+            self.insert_table(
+                df, table_name, delete_prev_records=False, sql_types=sql_types
+            )
+            return {"inserted": len(df), "updated": 0, "deleted": 0}
+
+        columns = [clean_col_name(column) for column in df.columns]
+        staged = self.loader.staged(self.loader.split(df), table_name, columns)
+        with staged as (source, _):
+            self.reopen_connection()
+            cursor = self.cnx.cursor()
             try:
-                query = f"DELETE FROM {table_name}"
-                cursor = self.cnx.cursor()
-                cursor.execute(query)
+                cursor.execute(
+                    self._merge_statement(
+                        table_name,
+                        f"({source})",
+                        columns,
+                        key_columns,
+                        ignore_changes,
+                        delete_missing,
+                    )
+                )
+                actions = Counter(row[0].lower() for row in cursor.fetchall())
+                self.cnx.commit()
             except Exception as e:
-                logger.error(f"Error on deleting {table_name} rows: {e}")
+                self.cnx.rollback()
+                logger.error(f"Error upserting into table {table_name}: {e}")
+                raise
+            finally:
+                self.release_connection()
 
-        custom = {}
+        changes = {
+            "inserted": actions["insert"],
+            "updated": actions["update"],
+            "deleted": actions["delete"],
+        }
+        logger.info(f"Upserted {len(df)} rows into {table_name} table: {changes}")
+        return changes
 
-        for column in df.columns.tolist():
-            if "timestamp" in column.lower():
-                custom[column] = "datetime"
+    def last_refreshed(self, table_name, key_column, timestamp_column, rc_column=None):
+        """Latest ``timestamp_column`` of every ``key_column`` value of
+        ``table_name``, only counting the rows whose ``rc_column`` return
+        code is 0 when the table has that column.
 
-            elif df.dtypes[column] != np.int64 and df.dtypes[column] != np.float64:
-                custom[column] = "varchar(100)"
+        :return: dict of key to timestamp, empty when the table does not exist
+        """
+        self.reopen_connection()
+        try:
+            cursor = self.cnx.cursor()
+            if not self._table_exists(cursor, table_name):
+                return {}
+            query = f"SELECT {key_column}, MAX({timestamp_column}) FROM {table_name}"
+            if rc_column and self._column_exists(cursor, table_name, rc_column):
+                query += f" WHERE {rc_column} = 0"
+            query += f" GROUP BY {key_column}"
+            logger.info(query)
+            cursor.execute(query)
+            return {key: refreshed_at for key, refreshed_at in cursor.fetchall()}
+        finally:
+            self.release_connection()
+
+    def _create_table(self, df, table_name, columns, sql_types, if_exists):
+        with self._create_lock:
+            self.reopen_connection()
+            try:
+                cursor = self.cnx.cursor()
+                if self._table_exists(cursor, table_name):
+                    if if_exists == "fail":
+                        raise RuntimeError(f"Table {table_name} already exists")
+                    if if_exists != "replace":
+                        return
+                    cursor.execute(f"DROP TABLE {table_name}")
+
+                types = self._column_types(df, sql_types)
+                definition = ", ".join(
+                    f"{column} {types[name]}"
+                    for column, name in zip(columns, df.columns)
+                )
+                cursor.execute(f"CREATE TABLE {table_name} ({definition})")
+                self.cnx.commit()
+                logger.info(f"Created table {table_name}")
+            finally:
+                self.release_connection()
 
+    def _create_shadow(self, table_name, shadow):
+        """Create ``shadow`` with the columns of ``table_name``.
+
+        :return: the statements creating its indexes and constraints and
+            granting its permissions
+        """
+        self.reopen_connection()
         try:
-            fast_to_sql(
-                df=df,
-                name=table_name,
-                conn=self.cnx,
-                if_exists=if_exists,
-                custom=custom,
+            cursor = self.cnx.cursor()
+            statements = [
+                *self._index_statements(cursor, table_name, shadow),
+                *self._constraint_statements(cursor, table_name, shadow),
+                *self._permission_statements(cursor, table_name, shadow),
+            ]
+            # Building the clustered index last would rebuild the others
+            indexes = sorted(statements, key=lambda s: " CLUSTERED " not in s)
+            cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+            cursor.execute(f"SELECT TOP 0 * INTO {shadow} FROM {table_name}")
+            self.cnx.commit()
+        finally:
+            self.release_connection()
+        return indexes
+
+    @staticmethod
+    def _index_statements(cursor, table_name, target):
+        """CREATE INDEX statements reproducing the clustered and
+        nonclustered indexes of ``table_name`` on ``target``, except those
+        of primary keys and unique constraints, see
+        ``_constraint_statements``."""
+        cursor.execute(
+            "SELECT i.name, i.type_desc, i.is_unique, i.filter_definition, "
+            "c.name, ic.is_descending_key, ic.is_included_column "
+            "FROM sys.indexes i "
+            "JOIN sys.index_columns ic "
+            "ON ic.object_id = i.object_id AND ic.index_id = i.index_id "
+            "JOIN sys.columns c "
+            "ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+            "WHERE i.object_id = OBJECT_ID(?) AND i.type IN (1, 2) "
+            "AND i.is_primary_key = 0 AND i.is_unique_constraint = 0 "
+            "ORDER BY i.index_id, ic.is_included_column, ic.key_ordinal, "
+            "ic.index_column_id",
+            table_name,
+        )
+        indexes = {}
+        for name, kind, unique, where, column, descending, included in cursor:
+            index = indexes.setdefault(
+                name, {"kind": kind, "unique": unique, "where": where}
+            )
+            if included:
+                index.setdefault("included", []).append(f"[{column}]")
+            else:
+                order = "DESC" if descending else "ASC"
+                index.setdefault("keys", []).append(f"[{column}] {order}")
+
+        statements = []
+        for name, index in indexes.items():
+            statement = (
+                f"CREATE {'UNIQUE ' if index['unique'] else ''}{index['kind']} "
+                f"INDEX [{name}] ON {target} ({', '.join(index['keys'])})"
+            )
+            if index.get("included"):
+                statement += f" INCLUDE ({', '.join(index['included'])})"
+            if index["where"]:
+                statement += f" WHERE {index['where']}"
+            statements.append(statement)
+        return statements
+
+    @classmethod
+    def _constraint_statements(cls, cursor, table_name, target):
+        """ALTER TABLE statements adding the primary key, unique, check,
+        default and foreign key constraints of ``table_name`` to ``target``,
+        named ``<constraint>__shadow`` as constraint names must be unique in
+        the schema; ``_swap_statements`` renames them."""
+        statements = []
+        cursor.execute(
+            "SELECT kc.name, kc.type, i.type_desc, c.name, ic.is_descending_key "
+            "FROM sys.key_constraints kc "
+            "JOIN sys.indexes i "
+            "ON i.object_id = kc.parent_object_id AND i.index_id = kc.unique_index_id "
+            "JOIN sys.index_columns ic "
+            "ON ic.object_id = i.object_id AND ic.index_id = i.index_id "
+            "JOIN sys.columns c "
+            "ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+            "WHERE kc.parent_object_id = OBJECT_ID(?) "
+            "ORDER BY kc.type, kc.name, ic.key_ordinal",
+            table_name,
+        )
+        keys = {}
+        for name, kind, index_kind, column, descending in cursor.fetchall():
+            key = keys.setdefault(name, {"kind": kind, "index": index_kind})
+            order = "DESC" if descending else "ASC"
+            key.setdefault("columns", []).append(f"[{column}] {order}")
+        for name, key in keys.items():
+            constraint = "PRIMARY KEY" if key["kind"].strip() == "PK" else "UNIQUE"
+            statements.append(
+                f"ALTER TABLE {target} ADD CONSTRAINT [{name}{SHADOW_SUFFIX}] "
+                f"{constraint} {key['index']} ({', '.join(key['columns'])})"
+            )
+
+        cursor.execute(
+            "SELECT d.name, c.name, d.definition FROM sys.default_constraints d "
+            "JOIN sys.columns c "
+            "ON c.object_id = d.parent_object_id AND c.column_id = d.parent_column_id "
+            "WHERE d.parent_object_id = OBJECT_ID(?)",
+            table_name,
+        )
+        for name, column, definition in cursor.fetchall():
+            statements.append(
+                f"ALTER TABLE {target} ADD CONSTRAINT [{name}{SHADOW_SUFFIX}] "
+                f"DEFAULT {definition} FOR [{column}]"
+            )
+
+        cursor.execute(
+            "SELECT name, definition, is_not_trusted FROM sys.check_constraints "
+            "WHERE parent_object_id = OBJECT_ID(?)",
+            table_name,
+        )
+        for name, definition, untrusted in cursor.fetchall():
+            statements.append(
+                f"ALTER TABLE {target} WITH {'NOCHECK' if untrusted else 'CHECK'} "
+                f"ADD CONSTRAINT [{name}{SHADOW_SUFFIX}] CHECK {definition}"
             )
-            logger.info(f"Inserted {len(df)} rows into {table_name} table")
+
+        for foreign_key in cls._foreign_keys(cursor, table_name, "parent"):
+            if foreign_key["referenced"] == foreign_key["parent"]:
+                foreign_key["referenced"] = target
+            foreign_key["name"] += SHADOW_SUFFIX
+            statements.append(cls._foreign_key_statement(target, foreign_key))
+        return statements
+
+    @staticmethod
+    def _permission_statements(cursor, table_name, target):
+        """GRANT and DENY statements reproducing the permissions on
+        ``table_name`` and its columns on ``target``."""
+        cursor.execute(
+            "SELECT p.state, p.permission_name, COL_NAME(p.major_id, p.minor_id), "
+            "u.name FROM sys.database_permissions p "
+            "JOIN sys.database_principals u "
+            "ON u.principal_id = p.grantee_principal_id "
+            "WHERE p.class = 1 AND p.major_id = OBJECT_ID(?)",
+            table_name,
+        )
+        statements = []
+        for state, permission, column, grantee in cursor.fetchall():
+            action = "DENY" if state.strip() == "D" else "GRANT"
+            columns = f" ([{column}])" if column else ""
+            statement = f"{action} {permission} ON {target}{columns} TO [{grantee}]"
+            if state.strip() == "W":
+                statement += " WITH GRANT OPTION"
+            statements.append(statement)
+        return statements
+
+    @staticmethod
+    def _foreign_keys(cursor, table_name, side):
+        """Foreign keys whose ``side``, ``parent`` or ``referenced``, is
+        ``table_name``, with their columns and referential actions."""
+        cursor.execute(
+            "SELECT fk.name, "
+            "QUOTENAME(OBJECT_SCHEMA_NAME(fk.parent_object_id)) + '.' "
+            "+ QUOTENAME(OBJECT_NAME(fk.parent_object_id)), "
+            "QUOTENAME(OBJECT_SCHEMA_NAME(fk.referenced_object_id)) + '.' "
+            "+ QUOTENAME(OBJECT_NAME(fk.referenced_object_id)), "
+            "pc.name, rc.name, fk.delete_referential_action_desc, "
+            "fk.update_referential_action_desc, fk.is_not_trusted "
+            "FROM sys.foreign_keys fk "
+            "JOIN sys.foreign_key_columns fkc "
+            "ON fkc.constraint_object_id = fk.object_id "
+            "JOIN sys.columns pc ON pc.object_id = fkc.parent_object_id "
+            "AND pc.column_id = fkc.parent_column_id "
+            "JOIN sys.columns rc ON rc.object_id = fkc.referenced_object_id "
+            "AND rc.column_id = fkc.referenced_column_id "
+            f"WHERE fk.{side}_object_id = OBJECT_ID(?) "
+            "ORDER BY fk.name, fkc.constraint_column_id",
+            table_name,
+        )
+        foreign_keys = {}
+        for row in cursor.fetchall():
+            name, parent, referenced, column, referenced_column = row[:5]
+            on_delete, on_update, untrusted = row[5:]
+            foreign_key = foreign_keys.setdefault(
+                name,
+                {
+                    "name": name,
+                    "parent": parent,
+                    "referenced": referenced,
+                    "on_delete": on_delete.replace("_", " "),
+                    "on_update": on_update.replace("_", " "),
+                    "untrusted": untrusted,
+                },
+            )
+            foreign_key.setdefault("columns", []).append(f"[{column}]")
+            foreign_key.setdefault("referenced_columns", []).append(
+                f"[{referenced_column}]"
+            )
+        return list(foreign_keys.values())
+
+    @staticmethod
+    def _foreign_key_statement(table_name, foreign_key):
+        return (
+            f"ALTER TABLE {table_name} "
+            f"WITH {'NOCHECK' if foreign_key['untrusted'] else 'CHECK'} "
+            f"ADD CONSTRAINT [{foreign_key['name']}] "
+            f"FOREIGN KEY ({', '.join(foreign_key['columns'])}) "
+            f"REFERENCES {foreign_key['referenced']} "
+            f"({', '.join(foreign_key['referenced_columns'])}) "
+            f"ON DELETE {foreign_key['on_delete']} "
+            f"ON UPDATE {foreign_key['on_update']}"
+        )
+
+    def _swap_statements(self, table_name, replacement):
+        """Statements renaming ``replacement``, the shadow or the previous
+        table, to ``table_name`` and ``table_name`` to
+        ``<table_name>__prev``, with their constraints. The triggers of
+        ``table_name`` and the foreign keys of other tables referencing it
+        are recreated on the new table; permissions stay with each table."""
+        previous = f"{table_name}{PREVIOUS_SUFFIX}"
+        shadow = f"{table_name}{SHADOW_SUFFIX}"
+        self.reopen_connection()
+        try:
+            cursor = self.cnx.cursor()
+            constraints = self._constraint_names(cursor, table_name)
+            replacement_constraints = self._constraint_names(cursor, replacement)
+            foreign_keys = self._foreign_keys(cursor, table_name, "referenced")
+            cursor.execute(
+                "SELECT t.name, m.definition, t.is_disabled FROM sys.triggers t "
+                "JOIN sys.sql_modules m ON m.object_id = t.object_id "
+                "WHERE t.parent_id = OBJECT_ID(?)",
+                table_name,
+            )
+            triggers = cursor.fetchall()
+        finally:
+            self.release_connection()
+
+        if replacement == previous:
+            # Park the current table under the shadow name while the previous
+            # one takes its place
+            statements = [
+                f"DROP TABLE IF EXISTS {shadow}",
+                *self._rename_statements(
+                    table_name, shadow, constraints, SHADOW_SUFFIX
+                ),
+                *self._rename_statements(previous, table_name, replacement_constraints),
+                *self._rename_statements(
+                    shadow,
+                    previous,
+                    [f"{name}{SHADOW_SUFFIX}" for name in constraints],
+                    PREVIOUS_SUFFIX,
+                ),
+            ]
+        else:
+            statements = [
+                f"DROP TABLE IF EXISTS {previous}",
+                *self._rename_statements(
+                    table_name, previous, constraints, PREVIOUS_SUFFIX
+                ),
+                *self._rename_statements(
+                    replacement, table_name, replacement_constraints
+                ),
+            ]
+
+        # Foreign keys and triggers stay with the renamed table otherwise
+        for foreign_key in foreign_keys:
+            if foreign_key["parent"] == foreign_key["referenced"]:
+                continue
+            statements += [
+                f"ALTER TABLE {foreign_key['parent']} "
+                f"DROP CONSTRAINT [{foreign_key['name']}]",
+                self._foreign_key_statement(
+                    foreign_key["parent"], {**foreign_key, "referenced": table_name}
+                ),
+            ]
+        schema = table_name.rpartition(".")[0]
+        prefix = f"{schema}." if schema else ""
+        for name, definition, disabled in triggers:
+            # The definition names table_name, which is the new table by now
+            statements += [f"DROP TRIGGER {prefix}[{name}]", definition]
+            if disabled:
+                statements.append(f"DISABLE TRIGGER {prefix}[{name}] ON {table_name}")
+        return statements
+
+    @staticmethod
+    def _rename_statements(table_name, target, constraints, suffix=""):
+        """Rename ``table_name`` to ``target`` and its ``constraints`` to
+        their original name followed by ``suffix``."""
+        schema = table_name.rpartition(".")[0]
+        prefix = f"{schema}." if schema else ""
+        statements = []
+        for constraint in constraints:
+            name = re.sub(f"({SHADOW_SUFFIX}|{PREVIOUS_SUFFIX})$", "", constraint)
+            if name + suffix != constraint:
+                statements.append(
+                    f"EXEC sp_rename '{prefix}[{constraint}]', "
+                    f"'{name}{suffix}', 'OBJECT'"
+                )
+        statements.append(
+            f"EXEC sp_rename '{table_name}', '{target.rpartition('.')[2]}'"
+        )
+        return statements
+
+    @staticmethod
+    def _constraint_names(cursor, table_name):
+        cursor.execute(
+            "SELECT name FROM sys.objects WHERE parent_object_id = OBJECT_ID(?) "
+            "AND type IN ('PK', 'UQ', 'C', 'D', 'F')",
+            table_name,
+        )
+        return [name for name, in cursor.fetchall()]
+
+    def _execute(self, *statements):
+        """Run ``statements`` in one transaction."""
+        self.reopen_connection()
+        try:
+            cursor = self.cnx.cursor()
+            for statement in statements:
+                cursor.execute(statement)
             self.cnx.commit()
-        except Exception as e:
-            logger.error(f"Error inserting into table {table_name}: {e}")
+        except Exception:
+            self.cnx.rollback()
             raise
         finally:
-            self.cnx.close()
+            self.release_connection()
+
+    def _drop_table(self, table_name):
+        try:
+            self._execute(f"DROP TABLE IF EXISTS {table_name}")
+        except pyodbc.Error as e:
+            logger.warning(f"Could not drop {table_name}: {e}")
+
+    @staticmethod
+    def _column_types(df, sql_types):
+        types = dict(sql_types or {})
+        for column in df.columns.tolist():
+            if column in types:
+                continue
+            elif "timestamp" in column.lower():
+                types[column] = "datetime"
+            elif pd.api.types.is_datetime64_any_dtype(df.dtypes[column]):
+                types[column] = "datetime"
+            elif df.dtypes[column] == np.int64:
+                types[column] = "bigint"
+            elif df.dtypes[column] == np.float64:
+                types[column] = "float"
+            else:
+                types[column] = "varchar(100)"
+        return types
+
+    @staticmethod
+    def _table_exists(cursor, table_name):
+        cursor.execute("SELECT OBJECT_ID(?, 'U')", table_name)
+        return cursor.fetchone()[0] is not None
 
     @staticmethod
-    def fecth_token():
-        credential = DefaultAzureCredential(exclude_shared_token_cache_credential=True)
-        token = credential.get_token("https://database.windows.net/.default").token
-        return token
+    def _column_exists(cursor, table_name, column):
+        cursor.execute("SELECT COL_LENGTH(?, ?)", table_name, column)
+        return cursor.fetchone()[0] is not None
+
+    @staticmethod
+    def _merge_statement(
+        table_name, source, columns, key_columns, ignore_changes, delete_missing=True
+    ):
+        keys = [clean_col_name(column) for column in key_columns]
+        ignored = {clean_col_name(column) for column in ignore_changes}
+        values = [column for column in columns if column not in keys]
+        compared = [column for column in values if column not in ignored]
+
+        on = " AND ".join(f"target.{key} = source.{key}" for key in keys)
+        statement = f"MERGE {table_name} WITH (HOLDLOCK) AS target\n"
+        statement += f"USING {source} AS source ON {on}\n"
+        if compared:
+            source = ", ".join(f"source.{column}" for column in compared)
+            target = ", ".join(f"target.{column}" for column in compared)
+            assignments = ", ".join(f"{column} = source.{column}" for column in values)
+            statement += (
+                f"WHEN MATCHED AND EXISTS (SELECT {source} EXCEPT SELECT {target})\n"
+                f"    THEN UPDATE SET {assignments}\n"
+            )
+        statement += (
+            f"WHEN NOT MATCHED BY TARGET\n"
+            f"    THEN INSERT ({', '.join(columns)})"
+            f" VALUES ({', '.join(f'source.{column}' for column in columns)})\n"
+        )
+        if delete_missing:
+            statement += "WHEN NOT MATCHED BY SOURCE\n    THEN DELETE\n"
+        statement += "OUTPUT $action;"
+        return statement
@@ -1,15 +1,31 @@
-from app import Client
-from app.loader import TickerLoader
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import Client, universe
+from app.backfill import BackfillState, date_windows, window_key
+from app.cache import ResponseCache, request_fingerprint
+from app.checkpoint import Checkpoint
+from app.jobs import load_jobs
+from app.metadata import MetadataCache
+from app.pipeline import Pipeline
 from app.session import get_session
-from config import logger, settings
-from database.mssql import MSSQLDatabase
-from transformer import Agent
+from config import logger, recorder, settings
+
+# pandas, the database drivers, the transformer and the sinks are imported by
+# the functions using them, so that a bdlc step only loads what it needs
 
 
-def load_tickers():
+def load_tickers(query=None):
+    from app.loader import TickerLoader
+
     try:
-        loader = TickerLoader(settings.DB_IDS_QUERY)
-        instruments = loader.fetch()
+        loader = TickerLoader(
+            query or settings.DB_IDS_QUERY, fetch_rows=settings.DB_IDS_FETCH_ROWS
+        )
+        with recorder.stage("load_tickers") as metrics:
+            instruments = loader.fetch()
+            metrics["rows"] = len(instruments)
         logger.info(
             f"Loaded instruments: {instruments[:3]}...",
         )
@@ -19,19 +35,66 @@ def load_tickers():
         raise
 
 
-def init_client(instruments):
+def select_universe(instruments, table_name, db_instance):
+    """Keep the instruments of an incremental run that are missing from
+    ``table_name``, stale or errored on their last refresh."""
+    if not settings.INCREMENTAL_UNIVERSE:
+        return instruments
+    with recorder.stage("universe") as metrics:
+        refreshed = db_instance.last_refreshed(
+            table_name,
+            settings.UNIVERSE_KEY_COLUMN,
+            "timestamp_created_utc",
+            rc_column=settings.UNIVERSE_RC_COLUMN,
+        )
+        selected = universe.pending(
+            instruments, refreshed, settings.UNIVERSE_MAX_AGE_HOURS
+        )
+        metrics["rows"] = len(selected)
+    logger.info(
+        f"Incremental universe: {len(selected)} of {len(instruments)} instruments "
+        f"missing, stale or errored in {table_name}"
+    )
+    return selected
+
+
+def init_client(
+    instruments, catalog_id=None, fields=None, session=None, date_range=None
+):
     try:
-        session = get_session(settings.CREDENTIALS)
-        client = Client(
-            instruments=instruments,
-            fields=settings.FIELDS,
+        if session is None:
+            session = get_session(settings.CREDENTIALS, init_metadata_cache())
+        client_kwargs = dict(
+            fields=settings.FIELDS if fields is None else fields,
             session=session,
             ti_usernumber=settings.TI_USERNUMBER,
             ti_serialnumber=settings.TI_SERIALNUMBER,
             ti_workstation=settings.TI_WORKSTATION,
             reply_timeout_min=settings.BBG_REPLY_TIMEOUT_MIN,
             identifier_type=settings.IDENTIFIER_TYPE,
+            catalog_id=catalog_id,
+            listen_mode=settings.LISTEN_MODE,
+            poll_interval_min=settings.POLL_INTERVAL_MIN_SEC,
+            poll_interval_max=settings.POLL_INTERVAL_MAX_SEC,
+            download_concurrency=settings.DOWNLOAD_CONCURRENCY,
+            download_max_resumes=settings.DOWNLOAD_MAX_RESUMES,
+            spool_dir=settings.DOWNLOAD_SPOOL_DIR,
+            date_range=date_range,
+            history_period=settings.BACKFILL_PERIOD,
         )
+        shard_size = settings.REQUEST_SHARD_SIZE
+        if shard_size and len(instruments) > shard_size:
+            from app.sharding import ShardedClient
+
+            client = ShardedClient(
+                instruments,
+                shard_size=shard_size,
+                concurrency=settings.REQUEST_CONCURRENCY,
+                max_retries=settings.SHARD_MAX_RETRIES,
+                **client_kwargs,
+            )
+        else:
+            client = Client(instruments=instruments, **client_kwargs)
         logger.info("Client created successfully")
         return client
     except Exception as e:
@@ -39,14 +102,439 @@ def init_client(instruments):
         raise
 
 
-def main():
+def receive_data(client):
+    """Download the whole response into one DataFrame. Streaming only avoids
+    buffering the raw file here, the response is held in memory once parsed;
+    ``run_pipelined`` consumes the chunks as they come instead."""
+    if not settings.DOWNLOAD_STREAM:
+        return client.listen()
+
+    import pandas as pd
+
+    chunks = list(client.listen_chunks(settings.DOWNLOAD_CHUNK_ROWS))
+    if not chunks:
+        return
+    return pd.concat(chunks, ignore_index=True)
+
+
+def init_metadata_cache():
+    if not settings.METADATA_CACHE_PATH:
+        return None
+    return MetadataCache(
+        settings.METADATA_CACHE_PATH,
+        namespace=settings.CREDENTIALS["client_id"],
+        catalog_ttl_hours=settings.METADATA_CATALOG_TTL_HOURS,
+    )
+
+
+def init_cache():
+    if not settings.RESPONSE_CACHE_DIR:
+        return None
+    return ResponseCache(
+        settings.RESPONSE_CACHE_DIR,
+        max_mb=settings.RESPONSE_CACHE_MAX_MB,
+        max_age_hours=settings.RESPONSE_CACHE_MAX_AGE_HOURS,
+    )
+
+
+def fingerprint(instruments):
+    return request_fingerprint(
+        instruments,
+        settings.FIELDS,
+        settings.IDENTIFIER_TYPE,
+        settings.TI_USERNUMBER,
+        settings.TI_SERIALNUMBER,
+        settings.TI_WORKSTATION,
+    )
+
+
+def init_checkpoint():
+    if not settings.CHECKPOINT_PATH:
+        return None
+    return Checkpoint(
+        settings.CHECKPOINT_PATH, max_age_hours=settings.CHECKPOINT_MAX_AGE_HOURS
+    )
+
+
+def resume_request(client, state):
+    try:
+        client.resume(state["client"])
+        return True
+    except (KeyError, ValueError) as e:
+        logger.warning(f"Cannot resume checkpointed request, resubmitting: {e}")
+        return False
+
+
+def submit_request(instruments, checkpoint, state):
+    catalog_id = state["client"]["catalog_id"] if state else None
+    client = init_client(instruments, catalog_id=catalog_id)
+    if not (state and resume_request(client, state)):
+        client.data_request()
+        logger.info("Data request sent to Bloomberg API")
+        if checkpoint:
+            checkpoint.mark_submitted(
+                client.fingerprint(), settings.FIELDS, client.checkpoint_state()
+            )
+    return client
+
+
+def request_data(instruments, cache, checkpoint):
+    state = checkpoint.load(fingerprint(instruments)) if checkpoint else None
+    if state and state["stage"] == Checkpoint.DOWNLOADED:
+        logger.info("Loading response downloaded by a previous run")
+        return checkpoint.load_data()
+
+    client = submit_request(instruments, checkpoint, state)
+    df = receive_data(client)
+    if df is not None and cache is not None:
+        cache.store(client.fingerprint(), client.output_key, df, client.request_id)
+    if df is not None and checkpoint:
+        checkpoint.mark_downloaded(df)
+    return df
+
+
+def can_pipeline(from_cache):
+    if not settings.PIPELINED or from_cache:
+        return False
+    if (
+        settings.WRITE_MODE not in ("replace", "swap")
+        or settings.COMPACT_DTYPES
+        or settings.INCREMENTAL_UNIVERSE
+        or settings.PARQUET_PATH
+    ):
+        logger.warning(
+            "Pipelined mode needs WRITE_MODE=replace or swap without "
+            "COMPACT_DTYPES, INCREMENTAL_UNIVERSE or PARQUET_PATH, running the "
+            "stages one after the other"
+        )
+        return False
+    return True
+
+
+def run_pipelined(instruments, cache, checkpoint, db_instance):
+    """Transform and insert the response chunk by chunk while it is still
+    being downloaded; the table is replaced once the last chunk is staged.
+
+    :return: number of rows inserted
+    """
+    import pandas as pd
+
+    from transformer import Agent
+
+    state = checkpoint.load(fingerprint(instruments)) if checkpoint else None
+    if state and state["stage"] == Checkpoint.DOWNLOADED:
+        logger.info("Loading response downloaded by a previous run")
+        client = None
+        source = [checkpoint.load_data()]
+    else:
+        client = submit_request(instruments, checkpoint, state)
+        source = client.listen_chunks(settings.DOWNLOAD_CHUNK_ROWS)
+    created_at = datetime.datetime.utcnow()
+    downloaded = []
+
+    def transform(chunk):
+        if client is not None and cache is not None:
+            downloaded.append(chunk)
+        with recorder.stage("transform") as metrics:
+            agent = Agent(chunk, settings.IGNORE_COLUMNS, created_at=created_at)
+            df = agent.transform()
+            metrics["rows"] = len(df)
+        return df
+
+    def write(chunks):
+        if settings.WRITE_MODE == "swap":
+            return db_instance.swap_chunks(chunks, settings.OUTPUT_TABLE)
+        return db_instance.insert_chunks(
+            chunks, settings.OUTPUT_TABLE, if_exists="append", delete_prev_records=True
+        )
+
+    pipeline = Pipeline(source, [transform], queue_size=settings.PIPELINE_QUEUE_SIZE)
+    with recorder.stage("pipeline") as metrics:
+        rows = pipeline.run(write)
+        metrics["rows"] = rows
+
+    if downloaded:
+        cache.store(
+            client.fingerprint(),
+            client.output_key,
+            pd.concat(downloaded, ignore_index=True),
+            client.request_id,
+        )
+    return rows
+
+
+def replay_data(instruments, cache):
+    if cache is None:
+        raise RuntimeError("Replaying from cache requires RESPONSE_CACHE_DIR")
+    df = cache.latest(fingerprint(instruments))
+    if df is None:
+        logger.warning("No cached response matches the current request")
+    return df
+
+
+def compact_data(df):
+    if not settings.COMPACT_DTYPES:
+        return df, None
+    from transformer import schema
+
+    with recorder.stage("schema") as metrics:
+        df, sql_types = schema.infer(
+            df,
+            overrides=schema.load_overrides(settings.SCHEMA_OVERRIDES_PATH),
+            category_max_ratio=settings.CATEGORY_MAX_RATIO,
+        )
+        metrics["rows"] = len(df)
+    return df, sql_types
+
+
+def write_data(db_instance, df, sql_types=None, table_name=None, field_group=None):
+    """Publish ``df`` to the output table and, with PARQUET_PATH, to the
+    Parquet dataset at the same time."""
+    from sinks import MSSQLSink, ParquetSink, publish
+
+    table_name = table_name or settings.OUTPUT_TABLE
+    sinks = [MSSQLSink(db_instance, table_name)]
+    if settings.PARQUET_PATH:
+        sinks.append(
+            ParquetSink(
+                settings.PARQUET_PATH,
+                dataset=table_name,
+                field_group=field_group or settings.PARQUET_FIELD_GROUP or table_name,
+                # An incremental run only holds part of the universe
+                replace=not settings.INCREMENTAL_UNIVERSE,
+            )
+        )
+    publish(sinks, df, sql_types)
+
+
+def submit_jobs(jobs, session):
+    """Load each distinct universe once and submit every job's request,
+    looking the catalog up for the first one only.
+
+    :return: clients by job name, and the names of the jobs that failed
+    """
+    from database.mssql import MSSQLDatabase
+
+    universes = {}
+    clients = {}
+    failed = []
+    catalog_id = None
+    db_instance = MSSQLDatabase()
+    for job in jobs:
+        try:
+            if job.ids_query not in universes:
+                universes[job.ids_query] = load_tickers(job.ids_query)
+            instruments = select_universe(
+                universes[job.ids_query], job.output_table, db_instance
+            )
+            if not instruments:
+                logger.info(f"Job {job.name}: universe up to date, nothing to request")
+                continue
+            client = init_client(
+                instruments,
+                catalog_id=catalog_id,
+                fields=job.fields,
+                session=session,
+            )
+            catalog_id = client.catalog_id
+            client.data_request()
+            clients[job.name] = client
+            logger.info(f"Job {job.name}: data request sent")
+        except Exception as e:
+            logger.error(f"Job {job.name}: submission failed: {e}")
+            failed.append(job.name)
+    return clients, failed
+
+
+def process_job(job, client, cache):
+    from database.mssql import MSSQLDatabase
+    from transformer import Agent
+
+    df = receive_data(client)
+    if df is None:
+        raise RuntimeError("no data received from Bloomberg API")
+    if cache is not None:
+        cache.store(client.fingerprint(), client.output_key, df, client.request_id)
+
+    with recorder.stage("transform") as metrics:
+        agent = Agent(df, job.ignore_columns, fields=job.fields)
+        df = agent.transform()
+        metrics["rows"] = len(df)
+    df, sql_types = compact_data(df)
+    # One instance per job: it holds its current connection, the pool behind
+    # it is shared
+    write_data(
+        MSSQLDatabase(),
+        df,
+        sql_types,
+        table_name=job.output_table,
+        field_group=job.name,
+    )
+    return len(df)
+
+
+def run_jobs(path):
+    """Run every job of the job file in this process over one Bloomberg
+    session and one database pool. All requests are submitted first, then
+    each response is processed as soon as it is delivered."""
+    jobs = load_jobs(path)
+    logger.info(f"Running {len(jobs)} jobs from {path}")
+    session = get_session(settings.CREDENTIALS, init_metadata_cache())
+    cache = init_cache()
+    clients, failed = submit_jobs(jobs, session)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(clients))) as executor:
+        futures = {
+            executor.submit(process_job, job, clients[job.name], cache): job
+            for job in jobs
+            if job.name in clients
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                rows = future.result()
+                logger.info(
+                    f"Job {job.name}: {rows} rows written to {job.output_table}"
+                )
+            except Exception as e:
+                logger.error(f"Job {job.name}: failed: {e}")
+                failed.append(job.name)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(jobs)} jobs failed: {failed}")
+    logger.info("All jobs complete")
+
+
+def backfill_window(client, window, state, key):
+    """Submit the HistoryRequest of one window and stream its response
+    through ``Agent`` into the output table, replacing the rows the window
+    may have written before."""
+    from database.mssql import MSSQLDatabase
+    from transformer import Agent
+
+    start, end = window
+    client.data_request()
+    created_at = datetime.datetime.utcnow()
+
+    def transformed():
+        for chunk in client.listen_chunks(settings.DOWNLOAD_CHUNK_ROWS):
+            with recorder.stage("transform") as metrics:
+                df = Agent(chunk, settings.IGNORE_COLUMNS, created_at=created_at)
+                df = df.transform()
+                metrics["rows"] = len(df)
+            yield df
+
+    date_column = settings.BACKFILL_DATE_COLUMN
+    next_day = end + datetime.timedelta(days=1)
+    with recorder.stage("insert") as metrics:
+        rows = MSSQLDatabase().insert_chunks(
+            transformed(),
+            settings.OUTPUT_TABLE,
+            delete_prev_records=False,
+            delete_where=(
+                f"{date_column} >= '{start.isoformat()}' "
+                f"AND {date_column} < '{next_day.isoformat()}'"
+            ),
+        )
+        metrics["rows"] = rows
+    if client.output_key is None:
+        raise RuntimeError(f"No response received for request {client.request_id}")
+    if state:
+        state.mark_completed(key, window, rows)
+    return rows
+
+
+def run_backfill(start, end):
+    """Load the history of ``start``..``end`` into the output table, one
+    HistoryRequest per window of BACKFILL_WINDOW_DAYS days with at most
+    BACKFILL_CONCURRENCY of them in flight. Windows recorded as completed
+    by a previous run are skipped."""
+    check_job_settings()
+    instruments = load_tickers()
+    state = BackfillState(settings.BACKFILL_STATE_PATH)
+    state = state if settings.BACKFILL_STATE_PATH else None
+    key = fingerprint(instruments)
+    completed = state.completed(key) if state else set()
+    windows = [
+        window
+        for window in date_windows(start, end, settings.BACKFILL_WINDOW_DAYS)
+        if window_key(window) not in completed
+    ]
+    logger.info(
+        f"Backfilling {start} to {end}: {len(windows)} windows to run, "
+        f"{len(completed)} already completed"
+    )
+    if not windows:
+        return
+
+    session = get_session(settings.CREDENTIALS, init_metadata_cache())
+    clients = []
+    catalog_id = None
+    for window in windows:
+        client = init_client(
+            instruments, catalog_id=catalog_id, session=session, date_range=window
+        )
+        catalog_id = client.catalog_id
+        clients.append(client)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=settings.BACKFILL_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(backfill_window, client, window, state, key): window
+            for client, window in zip(clients, windows)
+        }
+        for future in as_completed(futures):
+            window = futures[future]
+            try:
+                rows = future.result()
+                logger.info(f"Backfill window {window_key(window)}: {rows} rows")
+            except Exception as e:
+                logger.error(f"Backfill window {window_key(window)} failed: {e}")
+                failed.append(window_key(window))
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(windows)} windows failed: {failed}")
+    logger.info("Backfill complete")
+
+
+def check_job_settings():
+    missing = [
+        name
+        for name in ("DB_IDS_QUERY", "FIELDS", "OUTPUT_TABLE")
+        if not getattr(settings, name)
+    ]
+    if missing:
+        raise RuntimeError(f"Missing settings for a single job run: {missing}")
+
+
+def main(from_cache=False):
+    from database.mssql import MSSQLDatabase
+    from transformer import Agent
+
+    check_job_settings()
     logger.info("Initializing Data License Client")
     db_instance = MSSQLDatabase()
     instruments = load_tickers()
-    client = init_client(instruments)
-    client.data_request()
-    logger.info("Data request sent to Bloomberg API")
-    df = client.listen()
+    if not from_cache:
+        instruments = select_universe(instruments, settings.OUTPUT_TABLE, db_instance)
+        if not instruments:
+            logger.info("Universe up to date, nothing to request")
+            return
+    cache = init_cache()
+    checkpoint = init_checkpoint()
+    if can_pipeline(from_cache):
+        if not run_pipelined(instruments, cache, checkpoint, db_instance):
+            logger.warning("No data received from Bloomberg API")
+            return
+        if checkpoint:
+            checkpoint.clear()
+        logger.info("Processing complete")
+        return
+
+    if from_cache:
+        df = replay_data(instruments, cache)
+    else:
+        df = request_data(instruments, cache, checkpoint)
     if df is None:
         logger.warning("No data received from Bloomberg API")
         return
@@ -54,25 +542,77 @@ def main():
         logger.info("Data received, beginning transformation")
 
     logger.info("Transforming Data")
-    agent = Agent(df, settings.IGNORE_COLUMNS)
-    df = agent.transform()
+    with recorder.stage("transform") as metrics:
+        agent = Agent(df, settings.IGNORE_COLUMNS)
+        df = agent.transform()
+        metrics["rows"] = 0 if df is None else len(df)
     if df is None or df.empty:
         logger.warning("No data to transform or transformed DataFrame is empty")
         return
     else:
         logger.info("Data transformation completed")
 
+    df, sql_types = compact_data(df)
+
     logger.info("Preparing Database Inserter")
     if df is None:
         logger.warning("No data to be inserted.")
         return
 
     logger.info(f"\n{df}")
-    db_instance.insert_table(
-        df, settings.OUTPUT_TABLE, if_exists="append", delete_prev_records=True
-    )
+    write_data(db_instance, df, sql_types)
+    if checkpoint:
+        checkpoint.clear()
     logger.info("Processing complete")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bloomberg Data License Client")
+    parser.add_argument(
+        "--from-cache",
+        action="store_true",
+        help="replay the latest cached response instead of requesting Bloomberg",
+    )
+    parser.add_argument(
+        "--jobs",
+        metavar="PATH",
+        help="run every job of this JSON job file in one process",
+    )
+    parser.add_argument(
+        "--backfill",
+        nargs=2,
+        metavar=("START", "END"),
+        type=datetime.date.fromisoformat,
+        help="load the history of this inclusive date range (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--restore-previous",
+        action="store_true",
+        help="swap back the OUTPUT_TABLE version replaced by the last swap",
+    )
+    return parser.parse_args()
+
+
+def restore_previous():
+    from database.mssql import MSSQLDatabase
+
+    MSSQLDatabase().restore_previous(settings.OUTPUT_TABLE)
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    try:
+        if args.restore_previous:
+            settings.require(*settings.MSSQL, "OUTPUT_TABLE")
+        else:
+            settings.require(*settings.BLOOMBERG, *settings.MSSQL)
+        if args.restore_previous:
+            restore_previous()
+        elif args.jobs:
+            run_jobs(args.jobs)
+        elif args.backfill:
+            run_backfill(*args.backfill)
+        else:
+            main(from_cache=args.from_cache)
+    finally:
+        recorder.emit()
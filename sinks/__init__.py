@@ -0,0 +1,3 @@
+from sinks.mssql import MSSQLSink
+from sinks.parquet import ParquetSink
+from sinks.publish import publish
@@ -0,0 +1,46 @@
+from config import settings
+
+
+class MSSQLSink:
+    """Write the output to an MSSQL table the way WRITE_MODE says."""
+
+    stage = "insert"
+
+    def __init__(self, db_instance, table_name):
+        self.db_instance = db_instance
+        self.table_name = table_name
+
+    def __repr__(self):
+        return f"MSSQLSink({self.table_name})"
+
+    def write(self, df, sql_types=None):
+        if settings.INCREMENTAL_UNIVERSE:
+            # Only part of the universe was requested: merge it into the rows
+            # of the others. The new creation timestamps mark the rows as fresh.
+            self.db_instance.upsert_table(
+                df,
+                self.table_name,
+                key_columns=[settings.UNIVERSE_KEY_COLUMN],
+                sql_types=sql_types,
+                delete_missing=False,
+            )
+        elif settings.WRITE_MODE == "upsert":
+            self.db_instance.upsert_table(
+                df,
+                self.table_name,
+                key_columns=settings.UPSERT_KEY,
+                ignore_changes=settings.UPSERT_IGNORE_CHANGES,
+                sql_types=sql_types,
+            )
+        elif settings.WRITE_MODE == "replace":
+            self.db_instance.insert_table(
+                df,
+                self.table_name,
+                if_exists="append",
+                delete_prev_records=True,
+                sql_types=sql_types,
+            )
+        elif settings.WRITE_MODE == "swap":
+            self.db_instance.swap_table(df, self.table_name, sql_types=sql_types)
+        else:
+            raise ValueError(f"Unsupported write mode: {settings.WRITE_MODE}")
@@ -0,0 +1,84 @@
+import datetime
+import uuid
+
+import fsspec
+
+from config import logger
+
+# Python types fastparquet can infer an object column of, all values alike
+_OBJECT_TYPES = (str, bytes, int, float, bool)
+
+
+class ParquetSink:
+    """Write the output as a Parquet file of the partition
+    ``<root>/<dataset>/run_date=<date>/field_group=<group>/`` of a Hive
+    partitioned dataset, on any filesystem fsspec knows.
+
+    The file is written under a hidden temporary name and renamed into
+    place, so readers never see a partial file. With ``replace``, the files
+    of earlier runs in the same partition are then removed.
+    """
+
+    stage = "parquet"
+
+    def __init__(self, root, dataset, field_group, run_date=None, replace=True):
+        self.fs, self.root = fsspec.core.url_to_fs(root)
+        self.dataset = self._safe_name(dataset)
+        self.field_group = self._safe_name(field_group)
+        self.run_date = run_date or datetime.datetime.utcnow().date()
+        self.replace = replace
+
+    def __repr__(self):
+        return f"ParquetSink({self.partition})"
+
+    @property
+    def partition(self):
+        return (
+            f"{self.root.rstrip('/')}/{self.dataset}/run_date={self.run_date}"
+            f"/field_group={self.field_group}"
+        )
+
+    def write(self, df, sql_types=None):
+        partition = self.partition
+        self.fs.makedirs(partition, exist_ok=True)
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        name = f"part-{stamp}-{uuid.uuid4().hex[:8]}.parquet"
+        path = f"{partition}/{name}"
+        tmp_path = f"{partition}/.{name}.tmp"
+        try:
+            with self.fs.open(tmp_path, "wb") as f:
+                self._storable(df).to_parquet(f, engine="fastparquet", index=False)
+            self.fs.mv(tmp_path, path)
+        except BaseException:
+            if self.fs.exists(tmp_path):
+                self.fs.rm(tmp_path)
+            raise
+        logger.info(f"Wrote {len(df)} rows to {path}")
+
+        if self.replace:
+            for previous in self.fs.ls(partition, detail=False):
+                filename = previous.rstrip("/").rpartition("/")[2]
+                if filename.startswith("part-") and filename != name:
+                    logger.info(f"Removing the previous run's {previous}")
+                    self.fs.rm(previous)
+        return path
+
+    @staticmethod
+    def _storable(df):
+        """``df`` with its object columns fastparquet cannot store as text,
+        e.g. the timestamps, strings and None of the row-wise LAST_UPDATE."""
+        mixed = []
+        for column in df.columns:
+            if df[column].dtype != object:
+                continue
+            types = set(df[column].dropna().map(type))
+            if len(types) > 1 or not types <= set(_OBJECT_TYPES):
+                mixed.append(column)
+        if not mixed:
+            return df
+        logger.debug(f"Writing the mixed object columns {mixed} as text")
+        return df.astype({column: "string" for column in mixed})
+
+    @staticmethod
+    def _safe_name(name):
+        return "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from config import logger, recorder
+
+
+def publish(sinks, df, sql_types=None):
+    """Write ``df`` to every sink, each on its own thread, so that the
+    publish takes as long as the slowest sink rather than the sum. Every
+    sink runs to the end; the first failure is raised afterwards."""
+
+    def write(sink):
+        with recorder.stage(sink.stage) as metrics:
+            sink.write(df, sql_types)
+            metrics["rows"] = len(df)
+
+    if len(sinks) == 1:
+        write(sinks[0])
+        return
+
+    with ThreadPoolExecutor(max_workers=len(sinks)) as executor:
+        futures = [(sink, executor.submit(write, sink)) for sink in sinks]
+        errors = []
+        for sink, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Publishing to {sink!r} failed: {e}")
+                errors.append(e)
+    if errors:
+        raise errors[0]
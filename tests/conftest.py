@@ -0,0 +1,181 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import benchmark  # noqa: F401  (placeholder settings)
+from benchmark.payload import synthetic_records
+from benchmark.server import DataLicenseStub
+from config import settings
+
+
+class FakeServer:
+    """In-memory stand-in for SQL Server, understanding only the statements
+    the bulk loader and ``MSSQLDatabase.insert_chunks`` send. Every
+    statement is recorded; loading a staging table takes a little time so
+    that concurrent loads overlap."""
+
+    LOAD_DELAY_SEC = 0.02
+
+    def __init__(self):
+        self.tables = {}
+        self.columns = {}
+        self.statements = []
+        self.lock = threading.Lock()
+
+    def execute(self, statement, params):
+        with self.lock:
+            self.statements.append(statement)
+            return self._execute(statement, params)
+
+    def _execute(self, statement, params):
+        if statement.startswith("SELECT OBJECT_ID"):
+            return [(1 if params[0] in self.tables else None,)]
+        if match := re.match(r"CREATE TABLE (\S+) \((.*)\)$", statement):
+            name, definition = match.groups()
+            assert name not in self.tables, f"{name} created twice"
+            self.tables[name] = []
+            self.columns[name] = [
+                c.split()[0].strip("[]") for c in definition.split(", ")
+            ]
+        elif match := re.match(r"DROP TABLE (?:IF EXISTS )?(\S+)$", statement):
+            self.tables.pop(match.group(1), None)
+        elif match := re.match(r"SELECT TOP 0 (.*) INTO (\S+) FROM (\S+)", statement):
+            columns, heap, table = match.groups()
+            assert table in self.tables
+            self.tables[heap] = []
+            self.columns[heap] = [c.strip("[]") for c in columns.split(", ")]
+        elif match := re.match(
+            r"DELETE FROM (\S+) WHERE (\w+) >= '(.*)' AND \w+ < '(.*)'", statement
+        ):
+            table, column, start, end = match.groups()
+            position = self.columns[table].index(column)
+            self.tables[table] = [
+                row
+                for row in self.tables[table]
+                if not start <= str(row[position]) < end
+            ]
+        elif match := re.match(r"DELETE FROM (\S+)$", statement):
+            self.tables[match.group(1)] = []
+        elif match := re.match(
+            r"INSERT INTO (\S+) WITH \(TABLOCK\) \(.*?\) SELECT", statement
+        ):
+            rows = []
+            for heap in re.findall(r"FROM (\S+)", statement):
+                rows += self.tables[heap]
+            self.tables[match.group(1)] += rows
+        else:
+            raise NotImplementedError(statement)
+        return []
+
+    def load(self, statement, rows):
+        heap = re.match(r"INSERT INTO (\S+)", statement).group(1)
+        time.sleep(self.LOAD_DELAY_SEC)
+        with self.lock:
+            assert heap in self.tables, f"{heap} dropped while being loaded"
+            self.tables[heap] += [tuple(row) for row in rows]
+
+
+class FakeCursor:
+    def __init__(self, server):
+        self.server = server
+        self.fast_executemany = False
+        self._result = []
+
+    def execute(self, statement, *params):
+        self._result = self.server.execute(statement, params)
+        return self
+
+    def executemany(self, statement, rows):
+        self.server.load(statement, rows)
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return list(self._result)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def columns(self, table=None, schema=None):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self):
+        return FakeCursor(self.server)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeManager:
+    def __init__(self, server):
+        self.server = server
+
+    def acquire(self):
+        return FakeConnection(self.server)
+
+    def release(self, cnx):
+        pass
+
+    @contextmanager
+    def connection(self):
+        yield self.acquire()
+
+
+@pytest.fixture
+def sql_server(monkeypatch):
+    """A ``FakeServer`` behind every ``MSSQLDatabase`` created in the test."""
+    import database.mssql
+
+    server = FakeServer()
+    monkeypatch.setattr(
+        database.mssql, "get_manager", lambda *args: FakeManager(server)
+    )
+    return server
+
+
+@pytest.fixture
+def bloomberg(monkeypatch):
+    """A ``DataLicenseStub`` behind every ``Client`` and ``Session`` created
+    in the test, answering each request with synthetic records for its
+    universe. Polling starts right away and is repeated every 50 ms."""
+    from app.client import Client
+    from app.session import Session
+
+    fields = [field for field in settings.FIELDS if not field.startswith("@@")]
+
+    def responder(payload, request_id):
+        instruments = [
+            identifier["identifierValue"]
+            for identifier in payload["universe"]["contains"]
+        ]
+        return synthetic_records(
+            instruments, fields, request_id=request_id, name=payload["name"]
+        )
+
+    with DataLicenseStub(responder=responder) as stub:
+        monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+        monkeypatch.setattr(Client, "HOST", stub.url)
+        monkeypatch.setattr(Session, "OAUTH2_ENDPOINT", stub.url + stub.TOKEN_PATH)
+        monkeypatch.setattr(settings, "LISTEN_MODE", "poll")
+        monkeypatch.setattr(settings, "POLL_INTERVAL_MIN_SEC", 0.05)
+        monkeypatch.setattr(settings, "POLL_INTERVAL_MAX_SEC", 0.05)
+        monkeypatch.setattr(settings, "METADATA_CACHE_PATH", "")
+        yield stub
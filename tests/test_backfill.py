@@ -0,0 +1,76 @@
+import datetime
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import main
+import transformer
+from config import settings
+
+
+class WindowClient:
+    """Client delivering two chunks of rows dated within its window."""
+
+    def __init__(self, window):
+        self.window = window
+        self.output_key = None
+        self.request_id = f"r{window[0]}"
+
+    def data_request(self):
+        pass
+
+    def listen_chunks(self, chunk_size):
+        start, _ = self.window
+        for day in range(2):
+            date = (start + datetime.timedelta(days=day)).isoformat()
+            yield pd.DataFrame({"DATE": [date, date], "VALUE": [day, day + 10]})
+        self.output_key = f"{self.request_id}.json.gz"
+
+
+class Untransformed:
+    def __init__(self, df, *args, **kwargs):
+        self.df = df
+
+    def transform(self):
+        return self.df
+
+
+def test_concurrent_windows_load_a_new_table(sql_server, monkeypatch):
+    monkeypatch.setattr(transformer, "Agent", Untransformed)
+    monkeypatch.setattr(settings, "OUTPUT_TABLE", "history")
+    monkeypatch.setattr(settings, "BACKFILL_DATE_COLUMN", "DATE")
+    monkeypatch.setattr(settings, "INSERT_CONCURRENCY", 2)
+    monkeypatch.setattr(settings, "INSERT_CHUNK_ROWS", 1)
+    windows = [
+        (datetime.date(2024, 1, 1), datetime.date(2024, 1, 2)),
+        (datetime.date(2024, 1, 3), datetime.date(2024, 1, 4)),
+    ]
+
+    with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+        futures = [
+            executor.submit(
+                main.backfill_window, WindowClient(window), window, None, "key"
+            )
+            for window in windows
+        ]
+        rows = [future.result() for future in futures]
+
+    assert rows == [4, 4]
+    assert sorted(sql_server.tables["history"]) == [
+        ("2024-01-01", 0),
+        ("2024-01-01", 10),
+        ("2024-01-02", 1),
+        ("2024-01-02", 11),
+        ("2024-01-03", 0),
+        ("2024-01-03", 10),
+        ("2024-01-04", 1),
+        ("2024-01-04", 11),
+    ]
+    heaps = {
+        match.group(1)
+        for statement in sql_server.statements
+        if (match := re.match(r"SELECT TOP 0 .* INTO (\S+)", statement))
+    }
+    assert len(heaps) == 4
+    assert set(sql_server.tables) == {"history"}
@@ -0,0 +1,45 @@
+import argparse
+import json
+
+import pytest
+
+import bdlc
+import main
+from benchmark.payload import synthetic_universe
+from config import settings
+
+
+@pytest.fixture
+def sharded_request(bloomberg, monkeypatch, tmp_path):
+    """Checkpoint of a submitted request for 7 instruments in shards of 3."""
+    monkeypatch.setattr(settings, "REQUEST_SHARD_SIZE", 3)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(settings, "CHECKPOINT_PATH", str(tmp_path / "state.json"))
+    instruments = synthetic_universe(7)
+    checkpoint = main.init_checkpoint()
+    main.submit_request(instruments, checkpoint, None)
+    return instruments, checkpoint
+
+
+def test_collect_caches_a_sharded_response(sharded_request, monkeypatch):
+    instruments, checkpoint = sharded_request
+    with open(checkpoint.path) as f:
+        assert "instruments" not in json.load(f)
+    monkeypatch.setattr(main, "load_tickers", lambda: list(instruments))
+
+    bdlc.collect(argparse.Namespace(wait=True))
+
+    fingerprint = main.fingerprint(instruments)
+    assert checkpoint.load(fingerprint)["stage"] == checkpoint.DOWNLOADED
+    assert checkpoint.load_data()["IDENTIFIER"].tolist() == instruments
+    cached = main.init_cache().latest(fingerprint)
+    assert cached["IDENTIFIER"].tolist() == instruments
+
+
+def test_collect_refuses_a_changed_universe(sharded_request, monkeypatch):
+    instruments, checkpoint = sharded_request
+    monkeypatch.setattr(main, "load_tickers", lambda: instruments[1:])
+
+    with pytest.raises(RuntimeError, match="universe changed"):
+        bdlc.collect(argparse.Namespace(wait=True))
+    assert checkpoint.current()["stage"] == checkpoint.SUBMITTED
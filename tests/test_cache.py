@@ -0,0 +1,32 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from app.cache import ResponseCache
+
+
+def test_concurrent_stores_skip_unreadable_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_mb=1, max_age_hours=1)
+    broken_dir = tmp_path / "broken"
+    broken_dir.mkdir()
+    (broken_dir / "partial.parquet").write_bytes(b"")
+    (broken_dir / "partial.json").write_text('{"output_key": ')
+    df = pd.DataFrame({"TICKER": ["A", "B"], "PX_LAST": ["1.5", "2.5"]})
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        paths = list(
+            executor.map(
+                lambda n: cache.store(f"f{n % 2}", f"out{n}.json.gz", df), range(8)
+            )
+        )
+
+    assert all(os.path.exists(path) for path in paths)
+    assert not [
+        name
+        for _, _, names in os.walk(tmp_path)
+        for name in names
+        if name.endswith(".tmp")
+    ]
+    pd.testing.assert_frame_equal(cache.latest("f1"), df, check_dtype=False)
+    assert cache.latest("broken") is None
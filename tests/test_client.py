@@ -0,0 +1,41 @@
+import pytest
+
+from app.client import Client
+from benchmark.server import DataLicenseStub, stub_client
+
+RECORDS = [{"IDENTIFIER": "US0000000001", "PX_LAST": 1.0}]
+
+
+@pytest.mark.parametrize("notified", [True, False])
+def test_sse_listener_finds_a_delivery_racing_the_subscription(monkeypatch, notified):
+    with DataLicenseStub(heartbeat_sec=0.1) as stub:
+        client = stub_client(
+            stub,
+            ["US0000000001"],
+            ["PX_LAST"],
+            listen_mode="sse",
+            reply_timeout_min=0.02,
+            poll_interval_min=60,
+        )
+        client.data_request()
+        poll = Client._poll_responses
+
+        def deliver_after_first_poll(self, url, params):
+            found = poll(self, url, params)
+            if not stub.responses:
+                subscribers = stub._subscribers
+                if not notified:
+                    stub._subscribers = []
+                stub.deliver(
+                    f"{client.session_id}.json.gz",
+                    RECORDS,
+                    request_id=client.request_id,
+                )
+                stub._subscribers = subscribers
+            return found
+
+        monkeypatch.setattr(Client, "_poll_responses", deliver_after_first_poll)
+        df = client.listen()
+
+    assert df is not None
+    assert df.to_dict("records") == RECORDS
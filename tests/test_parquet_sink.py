@@ -0,0 +1,25 @@
+import pandas as pd
+
+from benchmark.payload import synthetic_records, synthetic_universe
+from config import settings
+from sinks import ParquetSink
+from transformer import Agent
+
+
+def test_writes_the_row_wise_agent_output(tmp_path):
+    fields = settings.FIELDS
+    records = synthetic_records(synthetic_universe(20), fields)
+    df = Agent(
+        pd.DataFrame(records), settings.IGNORE_COLUMNS, vectorized_dates=False
+    ).transform()
+    assert df["LAST_UPDATE"].dtype == object
+
+    path = ParquetSink(str(tmp_path), "bench", "prices").write(df)
+
+    written = pd.read_parquet(path, engine="fastparquet")
+    assert list(written.columns) == list(df.columns)
+    assert len(written) == len(df)
+    assert written["LAST_UPDATE"].isna().sum() == df["LAST_UPDATE"].isna().sum()
+    assert written["LAST_UPDATE"].dropna().tolist() == [
+        str(value) for value in df["LAST_UPDATE"].dropna()
+    ]
@@ -0,0 +1,59 @@
+import json
+
+import main
+from app.jobs import Job
+from benchmark.payload import synthetic_universe
+from config import settings
+
+
+def test_sharded_response_is_cached(bloomberg, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "REQUEST_SHARD_SIZE", 3)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_DIR", str(tmp_path))
+    instruments = synthetic_universe(7)
+    cache = main.init_cache()
+
+    df = main.request_data(instruments, cache, None)
+
+    assert df["IDENTIFIER"].tolist() == instruments
+    assert cache.latest(main.fingerprint(instruments))["IDENTIFIER"].tolist() == (
+        instruments
+    )
+    (metadata_path,) = tmp_path.glob("*/*.json")
+    request_ids = json.loads(metadata_path.read_text())["request_id"].split(",")
+    assert sorted(request_ids) == sorted(bloomberg.requests)
+    assert len(request_ids) == 3
+
+
+def test_sharded_pipelined_response_is_cached(
+    bloomberg, sql_server, monkeypatch, tmp_path
+):
+    from database.mssql import MSSQLDatabase
+
+    monkeypatch.setattr(settings, "REQUEST_SHARD_SIZE", 3)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "OUTPUT_TABLE", "prices")
+    monkeypatch.setattr(settings, "WRITE_MODE", "replace")
+    instruments = synthetic_universe(7)
+    cache = main.init_cache()
+
+    rows = main.run_pipelined(instruments, cache, None, MSSQLDatabase())
+
+    assert rows == len(sql_server.tables["prices"]) == len(instruments)
+    assert cache.latest(main.fingerprint(instruments))["IDENTIFIER"].tolist() == (
+        instruments
+    )
+
+
+def test_sharded_job_response_is_cached(bloomberg, sql_server, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "REQUEST_SHARD_SIZE", 3)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_DIR", str(tmp_path))
+    job = Job("equities", settings.FIELDS, "SELECT 1", "equities")
+    instruments = synthetic_universe(7)
+    client = main.init_client(instruments, fields=job.fields)
+    client.data_request()
+    cache = main.init_cache()
+
+    rows = main.process_job(job, client, cache)
+
+    assert rows == len(sql_server.tables["equities"]) == len(instruments)
+    assert cache.latest(client.fingerprint())["IDENTIFIER"].tolist() == instruments
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from transformer import schema
+
+
+def test_sql_types_leave_room_for_later_runs():
+    df = pd.DataFrame(
+        {
+            "FLAG": ["1", "2", "3"],
+            "VOLUME": ["10", None, "12"],
+            "PX_LAST": ["1.5", "2.25", "3.0"],
+            "CRNCY": ["USD", "EUR", None],
+            "DESCRIPTION": ["x" * 200, "y", "z"],
+            "EMPTY": [None, None, None],
+        }
+    )
+
+    compacted, sql_types = schema.infer(df, category_max_ratio=0)
+
+    assert sql_types == {
+        "FLAG": "bigint",
+        "VOLUME": "bigint",
+        "PX_LAST": "decimal(38,9)",
+        "CRNCY": "nvarchar(255)",
+        "DESCRIPTION": "nvarchar(max)",
+        "EMPTY": "nvarchar(255)",
+    }
+    assert str(compacted["FLAG"].dtype) == "int8"
+    assert str(compacted["VOLUME"].dtype) == "UInt8"
+    assert str(compacted["PX_LAST"].dtype) == "float32"
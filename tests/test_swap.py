@@ -0,0 +1,110 @@
+import pytest
+
+import database.mssql
+from database.mssql import MSSQLDatabase
+from tests.conftest import FakeManager
+
+TRIGGER = "CREATE TRIGGER dbo.trg_prices ON dbo.prices AFTER INSERT AS RETURN"
+
+
+class CatalogServer:
+    """Answers the catalog queries of a swap for ``dbo.prices``, which has a
+    clustered primary key, a default, a grant, a trigger and a foreign key
+    of ``dbo.positions`` referencing it."""
+
+    CONSTRAINTS = ["PK_prices", "DF_prices_SOURCE"]
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params):
+        if "sys.key_constraints" in statement:
+            return [("PK_prices", "PK", "CLUSTERED", "TICKER", False)]
+        if "sys.default_constraints" in statement:
+            return [("DF_prices_SOURCE", "SOURCE", "('BBG')")]
+        if "sys.database_permissions" in statement:
+            return [("G", "SELECT", None, "reporting")]
+        if "WHERE fk.referenced_object_id" in statement:
+            return [
+                (
+                    "FK_positions_prices",
+                    "[dbo].[positions]",
+                    "[dbo].[prices]",
+                    "TICKER",
+                    "TICKER",
+                    "NO_ACTION",
+                    "CASCADE",
+                    False,
+                )
+            ]
+        if "sys.triggers" in statement:
+            return [("trg_prices", TRIGGER, False)]
+        if "FROM sys.objects" in statement:
+            suffix = params[0].removeprefix("dbo.prices")
+            return [(f"{name}{suffix}",) for name in self.CONSTRAINTS]
+        if "FROM sys." in statement:
+            return []
+        self.statements.append(statement)
+        return []
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    server = CatalogServer()
+    monkeypatch.setattr(
+        database.mssql, "get_manager", lambda *args: FakeManager(server)
+    )
+    return server
+
+
+def test_shadow_gets_the_constraints_and_permissions(catalog):
+    statements = MSSQLDatabase()._create_shadow("dbo.prices", "dbo.prices__shadow")
+
+    assert statements == [
+        "ALTER TABLE dbo.prices__shadow ADD CONSTRAINT [PK_prices__shadow] "
+        "PRIMARY KEY CLUSTERED ([TICKER] ASC)",
+        "ALTER TABLE dbo.prices__shadow ADD CONSTRAINT [DF_prices_SOURCE__shadow] "
+        "DEFAULT ('BBG') FOR [SOURCE]",
+        "GRANT SELECT ON dbo.prices__shadow TO [reporting]",
+    ]
+
+
+def test_swap_moves_constraint_names_foreign_keys_and_triggers(catalog):
+    statements = MSSQLDatabase()._swap_statements("dbo.prices", "dbo.prices__shadow")
+
+    assert statements == [
+        "DROP TABLE IF EXISTS dbo.prices__prev",
+        "EXEC sp_rename 'dbo.[PK_prices]', 'PK_prices__prev', 'OBJECT'",
+        "EXEC sp_rename 'dbo.[DF_prices_SOURCE]', 'DF_prices_SOURCE__prev', 'OBJECT'",
+        "EXEC sp_rename 'dbo.prices', 'prices__prev'",
+        "EXEC sp_rename 'dbo.[PK_prices__shadow]', 'PK_prices', 'OBJECT'",
+        "EXEC sp_rename 'dbo.[DF_prices_SOURCE__shadow]', 'DF_prices_SOURCE', "
+        "'OBJECT'",
+        "EXEC sp_rename 'dbo.prices__shadow', 'prices'",
+        "ALTER TABLE [dbo].[positions] DROP CONSTRAINT [FK_positions_prices]",
+        "ALTER TABLE [dbo].[positions] WITH CHECK "
+        "ADD CONSTRAINT [FK_positions_prices] FOREIGN KEY ([TICKER]) "
+        "REFERENCES dbo.prices ([TICKER]) ON DELETE NO ACTION ON UPDATE CASCADE",
+        "DROP TRIGGER dbo.[trg_prices]",
+        TRIGGER,
+    ]
+
+
+def test_restore_swaps_the_constraint_names_back(catalog):
+    statements = MSSQLDatabase()._swap_statements("dbo.prices", "dbo.prices__prev")
+
+    assert statements[:10] == [
+        "DROP TABLE IF EXISTS dbo.prices__shadow",
+        "EXEC sp_rename 'dbo.[PK_prices]', 'PK_prices__shadow', 'OBJECT'",
+        "EXEC sp_rename 'dbo.[DF_prices_SOURCE]', 'DF_prices_SOURCE__shadow', "
+        "'OBJECT'",
+        "EXEC sp_rename 'dbo.prices', 'prices__shadow'",
+        "EXEC sp_rename 'dbo.[PK_prices__prev]', 'PK_prices', 'OBJECT'",
+        "EXEC sp_rename 'dbo.[DF_prices_SOURCE__prev]', 'DF_prices_SOURCE', "
+        "'OBJECT'",
+        "EXEC sp_rename 'dbo.prices__prev', 'prices'",
+        "EXEC sp_rename 'dbo.[PK_prices__shadow]', 'PK_prices__prev', 'OBJECT'",
+        "EXEC sp_rename 'dbo.[DF_prices_SOURCE__shadow]', "
+        "'DF_prices_SOURCE__prev', 'OBJECT'",
+        "EXEC sp_rename 'dbo.prices__shadow', 'prices__prev'",
+    ]
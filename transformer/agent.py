@@ -2,63 +2,81 @@ import datetime
 
 import pandas as pd
 
-from config import logger, settings
+from config import logger, recorder, settings
+from transformer import dates
+from transformer.plan import ColumnPlan
 
 
 class Agent:
 
-    def __init__(self, df, ignore_columns) -> None:
+    DATE_COLUMNS = [
+        "LAST_UPDATE",
+        "LAST_UPDATE_DT",
+        "LAST_TRADE_DATE",
+        "LAST_TRADE_TIME",
+    ]
+
+    def __init__(
+        self, df, ignore_columns, vectorized_dates=None, created_at=None, fields=None
+    ) -> None:
         self.df = df
         self.ignore_columns = ignore_columns
+        self.fields = settings.FIELDS if fields is None else fields
+        if vectorized_dates is None:
+            vectorized_dates = settings.VECTORIZED_DATES
+        self.vectorized_dates = vectorized_dates
+        # Chunks of the same run share one creation timestamp
+        self.created_at = created_at
+        self.plan = ColumnPlan.compile(tuple(self.fields), tuple(ignore_columns))
 
     def transform(self):
-        self.add_empty_columns()
-        self.reformat_date_columns()
-        self.add_timestamp()
-        self.remove_columns()
+        with recorder.stage("transform_columns") as metrics:
+            self.add_empty_columns()
+            metrics["rows"] = len(self.df)
+        with recorder.stage("transform_dates") as metrics:
+            self.reformat_date_columns()
+            metrics["rows"] = len(self.df)
+        with recorder.stage("transform_output") as metrics:
+            self.add_timestamp()
+            self.remove_columns()
+            metrics["rows"] = len(self.df)
         return self.df
 
     def add_empty_columns(self):
-        df_columns = list(self.df.columns)
-        logger.debug(f"Raw BBG dataframe columns: {', '.join(df_columns)}")
-        new_columns_set = self.find_columns_intersection(df_columns)
-        self.df = self.df.reindex(columns=new_columns_set)
-        return
-
-    def find_columns_intersection(self, df_columns):
-        """E.G. @@A is Tagged column. @@ is used to tag columns to bypass BBG
-        API but only included in the output table acting as a empty
-        columns and placeholder for further post processing
-        """
-
-        def find_unexpected_columns_range(df_columns, not_tagged_columns):
-            for i in range(len(df_columns)):
-                if df_columns[i:] == not_tagged_columns:
-                    return (0, i)
-            else:
-                return False
-
-        not_tagged_columns = [
-            col for col in settings.FIELDS if not col.startswith("@@")
-        ]
-        i_a, i_b = find_unexpected_columns_range(df_columns, not_tagged_columns)
-        return list(
-            df_columns[i_a:i_b] + [col.replace("@@", "") for col in settings.FIELDS]
-        )
+        logger.debug(f"Raw BBG dataframe columns: {', '.join(self.df.columns)}")
+        self.df = self.plan.project(self.df)
 
     def remove_columns(self):
-        self.df.drop(columns=self.ignore_columns, inplace=True)
+        self.df = self.plan.drop_ignored(self.df)
 
     def reformat_date_columns(self):
+        missing = [column for column in self.DATE_COLUMNS if column not in self.df]
+        if missing:
+            # e.g. history requests, which rarely ask for these fields
+            logger.debug(f"No timestamp_read_utc without {', '.join(missing)}")
+            return
+
+        if self.vectorized_dates:
+            self._normalize_date_columns()
+            return
+
         self.df["LAST_UPDATE"] = self.df.apply(self._reformat_last_update, axis=1)
-        self.df["LAST_TRADE"] = (
-            f"{self.df['LAST_TRADE_DATE']} {self.df['LAST_TRADE_TIME']}"  # noqa: E501
-        )
+        self.df["LAST_TRADE"] = dates.last_trade(self.df)
         self.df["timestamp_read_utc"] = self.df.apply(self.to_date, axis=1)
         del self.df["LAST_TRADE"]
 
+    def _normalize_date_columns(self):
+        """Same result as the row-wise path, kept as datetime64 columns."""
+        last_update = dates.normalize_last_update(
+            self.df["LAST_UPDATE"], self.df["LAST_UPDATE_DT"]
+        )
+        self.df["LAST_UPDATE"] = last_update
+        self.df["timestamp_read_utc"] = dates.normalize_read_timestamp(
+            last_update, dates.last_trade(self.df)
+        )
+
     def add_timestamp(self):
-        self.df["timestamp_created_utc"] = datetime.datetime.utcnow()
+        self.df["timestamp_created_utc"] = self.created_at or datetime.datetime.utcnow()
 
     @staticmethod
     def _parse_date(date_str, formats):
@@ -72,7 +90,7 @@ class Agent:
     @staticmethod
     def to_date(row):
         x, y = row["LAST_UPDATE"], row["LAST_TRADE"]
-        date_str = x if x is not None else y if y is not None else None
+        date_str = x if not pd.isna(x) else y if not pd.isna(y) else None
         if date_str is None:
             return None
 
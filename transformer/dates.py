@@ -0,0 +1,80 @@
+import pandas as pd
+
+LAST_UPDATE_DATE_FORMAT = "%Y%m%d"
+LAST_UPDATE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+READ_TIMESTAMP_FORMATS = ["%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y%m%d"]
+
+
+def last_trade(df):
+    """Combine LAST_TRADE_DATE and LAST_TRADE_TIME into one text column."""
+    return df["LAST_TRADE_DATE"].astype(str) + " " + df["LAST_TRADE_TIME"].astype(str)
+
+
+def normalize_last_update(last_update, last_update_dt):
+    """Vectorized equivalent of ``Agent._reformat_last_update``.
+
+    Values holding a time of day are parsed on their own first and then
+    prefixed with LAST_UPDATE_DT; plain values are parsed as %Y%m%d dates.
+    Returns a datetime64 column, NaT where the row-wise path returns None.
+    """
+    x, x_is_str = _as_text(last_update)
+    y, y_is_str = _as_text(last_update_dt)
+    valid = x_is_str | y_is_str
+    has_time = x.str.contains(":", regex=False)
+
+    result = _empty_datetimes(x.index)
+    _parse_into(result, x, valid & ~has_time, LAST_UPDATE_DATE_FORMAT)
+    _parse_into(result, x, valid & has_time, LAST_UPDATE_TIME_FORMAT)
+    _parse_into(
+        result,
+        y + " " + x,
+        valid & has_time & y_is_str & result.isna(),
+        LAST_UPDATE_TIME_FORMAT,
+    )
+    return result
+
+
+def normalize_read_timestamp(last_update, last_trade):
+    """Vectorized equivalent of ``Agent.to_date``.
+
+    ``last_update`` is the output of ``normalize_last_update``; rows where
+    it is missing fall back to ``last_trade``, tried against every
+    candidate format in turn.
+    """
+    result = pd.Series(last_update, dtype="datetime64[ns]", copy=True)
+    text = last_trade.astype(str).str.replace("T", " ", regex=False)
+    for fmt in READ_TIMESTAMP_FORMATS:
+        _parse_into(result, text, result.isna(), fmt)
+    return result.dt.floor("s")
+
+
+def _parse_into(result, text, mask, fmt):
+    if mask.any():
+        result[mask] = pd.to_datetime(text[mask], format=fmt, errors="coerce")
+
+
+def _empty_datetimes(index):
+    return pd.Series(pd.NaT, index=index, dtype="datetime64[ns]")
+
+
+def _as_text(series):
+    """Return the column as text together with a mask of the values that
+    were strings, applying the same coercions as the row-wise path:
+    missing values become "" and numbers lose their fractional part.
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        is_str = pd.Series(False, index=series.index)
+        numbers = series
+    else:
+        if pd.api.types.is_string_dtype(series) and series.dtype != object:
+            is_str = series.notna()
+        else:
+            is_str = series.map(type).eq(str)
+        numbers = pd.to_numeric(series.where(~is_str), errors="coerce")
+
+    text = pd.Series("", index=series.index, dtype=object)
+    text[is_str] = series[is_str]
+    is_number = numbers.notna() & ~is_str
+    if is_number.any():
+        text[is_number] = numbers[is_number].astype("int64").astype(str)
+    return text.astype(str), is_str
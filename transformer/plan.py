@@ -0,0 +1,61 @@
+import functools
+
+TAG = "@@"
+
+
+class ColumnPlan:
+    """Column layout of the transformed output for one field configuration.
+
+    The response columns are the request metadata (DL_REQUEST_ID,
+    IDENTIFIER, ...) followed by the requested fields in order. The output
+    keeps the metadata, then every field of ``fields`` in order, where ``@@``
+    tagged fields, which are not sent to Bloomberg, become empty placeholder
+    columns. ``ignore_columns`` are dropped once the dates are derived.
+
+    Build it with ``compile`` so that every frame and chunk of the same
+    configuration shares one plan.
+    """
+
+    def __init__(self, fields, ignore_columns):
+        self.requested = [field for field in fields if not field.startswith(TAG)]
+        self.columns = [field.replace(TAG, "") for field in fields]
+        self.ignore_columns = list(ignore_columns)
+        self._layouts = {}
+
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    def compile(cls, fields, ignore_columns):
+        """Plan of ``fields`` and ``ignore_columns``, given as tuples."""
+        return cls(fields, ignore_columns)
+
+    def layout(self, df_columns):
+        """Output columns, before the ignored ones are dropped, of a response
+        with ``df_columns``."""
+        key = tuple(df_columns)
+        if key not in self._layouts:
+            start = len(key) - len(self.requested)
+            if start < 0 or list(key[start:]) != self.requested:
+                raise ValueError(self._mismatch(key))
+            self._layouts[key] = list(key[:start]) + self.columns
+        return self._layouts[key]
+
+    def project(self, df):
+        """Reorder ``df`` to the output layout in one pass, adding the
+        placeholder columns. A frame already laid out is not copied: the
+        shallow copy only keeps the caller's frame from being modified."""
+        layout = self.layout(df.columns)
+        if len(layout) == len(df.columns) and (df.columns == layout).all():
+            return df.copy(deep=False)
+        return df.reindex(columns=layout)
+
+    def drop_ignored(self, df):
+        return df.drop(columns=self.ignore_columns)
+
+    def _mismatch(self, df_columns):
+        missing = [field for field in self.requested if field not in df_columns]
+        if missing:
+            return f"Response is missing the requested fields {missing}"
+        return (
+            f"Response columns do not end with the {len(self.requested)} "
+            f"requested fields in order: {list(df_columns)}"
+        )
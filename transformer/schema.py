@@ -0,0 +1,155 @@
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from config import logger
+
+MAX_DECIMAL_SCALE = 9
+MAX_DECIMAL_PRECISION = 38
+DATE_PREFIX = r"^\d{4}-\d{2}-\d{2}"
+LEADING_ZERO = r"^-?0\d"
+# The table is created from the first run only, so the SQL types leave room
+# for the values of later runs while the dtypes fit the current one
+INTEGER_SQL_TYPE = "bigint"
+DECIMAL_SQL_TYPE = f"decimal({MAX_DECIMAL_PRECISION},{MAX_DECIMAL_SCALE})"
+NVARCHAR_LENGTH = 255
+# Text columns get nvarchar(max) unless their longest value is this many
+# times shorter than NVARCHAR_LENGTH
+NVARCHAR_HEADROOM = 2
+DEFAULT_SQL_TYPE = f"nvarchar({NVARCHAR_LENGTH})"
+NULLABLE_INTEGER_DTYPES = [
+    ("UInt8", 0, 255),
+    ("Int16", -(2**15), 2**15 - 1),
+    ("Int32", -(2**31), 2**31 - 1),
+    ("Int64", -(2**63), 2**63 - 1),
+]
+
+
+def load_overrides(path):
+    """Read a JSON object mapping column names to SQL types, e.g.
+    ``{"PX_LAST": "decimal(19,6)", "NAME": "nvarchar(256)"}``."""
+    if not path:
+        return {}
+    with open(path) as f:
+        overrides = json.load(f)
+    if not isinstance(overrides, dict):
+        raise ValueError(f"Schema overrides in {path} must be a JSON object")
+    return overrides
+
+
+def infer(df, overrides=None, category_max_ratio=0.5):
+    """Compact the dtypes of ``df`` and return it with the matching SQL types.
+
+    Numeric text becomes the smallest integer or float dtype holding it
+    exactly, ISO date text becomes datetime64, and text columns with at most
+    ``category_max_ratio`` distinct values per row become categoricals. Each
+    SQL type is sized from the data, with headroom for later runs, unless
+    ``overrides`` names the column.
+    """
+    overrides = overrides or {}
+    columns = {}
+    sql_types = {}
+    for column in df.columns:
+        columns[column], sql_types[column] = _infer_column(
+            df[column], category_max_ratio
+        )
+        if column in overrides:
+            sql_types[column] = overrides[column]
+
+    compacted = pd.DataFrame(columns, index=df.index)
+    # Measuring the memory of text columns walks every string
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            f"Compacted DataFrame from {_megabytes(df):.1f} MB "
+            f"to {_megabytes(compacted):.1f} MB, SQL types: {sql_types}"
+        )
+    return compacted, sql_types
+
+
+def _infer_column(series, category_max_ratio):
+    if series.isna().all():
+        return series, DEFAULT_SQL_TYPE
+    if pd.api.types.is_bool_dtype(series):
+        return series, "bit"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, _datetime_type(series)
+    if pd.api.types.is_numeric_dtype(series):
+        return _numeric(series)
+
+    text = series.astype("str").where(series.notna())
+    numbers = pd.to_numeric(text, errors="coerce")
+    if numbers.notna().sum() == text.notna().sum():
+        # Codes such as CUSIPs look numeric but lose their leading zeros
+        zero_led = text.str.startswith(("0", "-0"))
+        if not (zero_led.any() and text[zero_led].str.contains(LEADING_ZERO).any()):
+            return _numeric(numbers)
+
+    if text.dropna().iloc[0:1].str.match(DATE_PREFIX).all():
+        parsed = pd.to_datetime(text, format="ISO8601", errors="coerce")
+        if parsed.notna().sum() == text.notna().sum():
+            if (text.dropna().str.len() == 10).all():
+                return parsed, "date"
+            return parsed, _datetime_type(parsed)
+
+    sql_type = _nvarchar(text)
+    if text.nunique() <= category_max_ratio * len(text):
+        return text.astype("category"), sql_type
+    return text, sql_type
+
+
+def _numeric(series):
+    values = series.to_numpy(dtype="float64", na_value=np.nan)
+    present = values[~np.isnan(values)]
+    scale = _decimal_scale(present)
+    if scale == 0:
+        return _integer(series, present)
+
+    if np.array_equal(present.astype(np.float32).astype(np.float64), present):
+        series = series.astype("float32")
+    else:
+        series = series.astype("float64")
+    if scale is None:
+        return series, "float"
+
+    digits = len(str(int(np.abs(present).max())))
+    if digits + MAX_DECIMAL_SCALE > MAX_DECIMAL_PRECISION:
+        return series, "float"
+    return series, DECIMAL_SQL_TYPE
+
+
+def _integer(series, present):
+    if len(present) < len(series):
+        low, high = present.min(), present.max()
+        for dtype, type_low, type_high in NULLABLE_INTEGER_DTYPES:
+            if type_low <= low and high <= type_high:
+                break
+        return series.astype("float64").astype(dtype), INTEGER_SQL_TYPE
+    return pd.to_numeric(series, downcast="integer"), INTEGER_SQL_TYPE
+
+
+def _decimal_scale(values):
+    """Smallest number of decimal places representing every value, None
+    past MAX_DECIMAL_SCALE (e.g. for values sent in scientific notation)."""
+    for scale in range(MAX_DECIMAL_SCALE + 1):
+        scaled = values * 10**scale
+        if np.allclose(scaled, np.round(scaled), rtol=1e-12, atol=1e-6):
+            return scale
+    return None
+
+
+def _datetime_type(series):
+    if (series.dropna().dt.microsecond == 0).all():
+        return "datetime2(0)"
+    return "datetime2"
+
+
+def _megabytes(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def _nvarchar(text):
+    if int(text.str.len().max()) * NVARCHAR_HEADROOM > NVARCHAR_LENGTH:
+        return "nvarchar(max)"
+    return DEFAULT_SQL_TYPE